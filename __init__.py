@@ -1 +1,27 @@
-"""Pulse-eight integration"""
\ No newline at end of file
+"""Pulse-eight integration"""
+from homeassistant.const import CONF_HOST, CONF_PORT
+from homeassistant.helpers.storage import STORAGE_DIR
+
+from .const import DOMAIN, PLATFORMS
+from .pyp8 import async_acquire_amp_controller, async_release_amp_controller
+
+
+def label_cache_path(hass, host, port):
+    """Where the zone and source names discovered from a matrix are cached."""
+    return hass.config.path(STORAGE_DIR, f'{DOMAIN}.labels.{host}_{port}.json')
+
+
+async def async_setup_entry(hass, entry):
+    """Set up a matrix without waiting for it, entities stay unavailable until it connects."""
+    amp = await async_acquire_amp_controller(entry.data[CONF_HOST], entry.data[CONF_PORT], wait=False)
+    hass.data.setdefault(DOMAIN, {})[entry.entry_id] = amp
+    await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
+    return True
+
+
+async def async_unload_entry(hass, entry):
+    unloaded = await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
+    if unloaded:
+        amp = hass.data[DOMAIN].pop(entry.entry_id)
+        await async_release_amp_controller(amp)
+    return unloaded
@@ -0,0 +1 @@
+"""Benchmarks for the pyp8 library, run from the repository root."""
@@ -0,0 +1,130 @@
+"""Run every pyp8 benchmark against the simulator and print JSON results.
+
+Usage: python -m benchmarks [--output results.json]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import statistics
+import time
+
+from pyp8 import async_get_amp_controller
+from pyp8.simulator import MatrixSimulator
+
+from . import parser, registry, startup
+
+
+class ReplyCounter:
+    """Wraps a connection's reply callback so a benchmark can wait for a number of replies."""
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.count = 0
+        self._target = None
+        self._reached = asyncio.Event()
+
+    async def __call__(self, message):
+        await self.callback(message)
+        self.count += 1
+        if self._target is not None and self.count >= self._target:
+            self._reached.set()
+
+    async def wait_for(self, replies, timeout=30):
+        self._target = self.count + replies
+        self._reached.clear()
+        if self.count < self._target:
+            await asyncio.wait_for(self._reached.wait(), timeout)
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+async def bench_response_cb(amp, lines=parser.sample_lines(), rounds=500):
+    """Parse and fan out replies through response_cb without a socket."""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for line in lines:
+            await amp.response_cb(line)
+    return {'lines_per_second': rounds * len(lines) / (time.perf_counter() - start)}
+
+
+async def bench_send_command(amp, counter, commands=2000):
+    """Push distinct commands through the queue until every reply is back."""
+    start = time.perf_counter()
+    for i in range(commands):
+        await amp.connection.send_command(f'^VPZ @{i % 64 + 1}, {i % 101}$')
+    await counter.wait_for(commands)
+    return {'commands_per_second': commands / (time.perf_counter() - start)}
+
+
+async def bench_sweep(amp, zones):
+    start = time.perf_counter()
+    status = await amp.get_status_many(range(1, zones + 1))
+    return {
+        'seconds': time.perf_counter() - start,
+        'fields': sum(len(fields) for fields in status.values()),
+    }
+
+
+async def bench_reconnect(amp, simulator, counter, zones=32):
+    """Time from a dropped link until every known zone has been resynced."""
+    await amp.get_status_many(range(1, zones + 1))
+    start = time.perf_counter()
+    simulator.drop_connections()
+    await counter.wait_for(len(amp.zones) * 4)
+    return {'seconds': time.perf_counter() - start, 'zones': len(amp.zones)}
+
+
+async def bench_confirmation(amp, commands=200):
+    amp.command_latency.clear()
+    for i in range(commands):
+        await amp.set_volume(i % 64 + 1, i % 101, confirm=True)
+    samples = list(amp.command_latency)
+    return {
+        'p50_ms': percentile(samples, 0.5) * 1000,
+        'p99_ms': percentile(samples, 0.99) * 1000,
+        'mean_ms': statistics.mean(samples) * 1000,
+    }
+
+
+async def run():
+    simulator = MatrixSimulator(zones=64)
+    port = await simulator.start()
+    amp = await async_get_amp_controller('127.0.0.1', port)
+    counter = amp.connection.callback = ReplyCounter(amp.response_cb)
+    await amp.connect()
+    try:
+        results = {
+            'python': platform.python_version(),
+            'parser': parser.run(),
+            'response_cb': await bench_response_cb(amp),
+            'send_command': await bench_send_command(amp, counter),
+            'sweep_32_zones': await bench_sweep(amp, 32),
+            'sweep_64_zones': await bench_sweep(amp, 64),
+            'reconnect_resync': await bench_reconnect(amp, simulator, counter),
+            'confirmation_latency': await bench_confirmation(amp),
+        }
+    finally:
+        await amp.close()
+        await simulator.stop()
+    results['registry'] = await registry.run()
+    results['startup'] = await startup.run()
+    return results
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(description='Benchmark pyp8 against the matrix simulator')
+    argparser.add_argument('--output', help='Write results to this file instead of stdout')
+    args = argparser.parse_args()
+
+    logging.disable(logging.WARNING)
+    results = json.dumps(asyncio.run(run()), indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(results + '\n')
+    else:
+        print(results)
@@ -0,0 +1,62 @@
+"""Compare response parsing throughput with the original regex cascade.
+
+Usage: python -m benchmarks.parser
+"""
+import re
+import time
+
+from pyp8.protocol import PARSER
+
+# The sequential matcher previously used by AmpControlAsync.response_cb
+ZONE_REGEXP = [ re.compile(r'\^\=PZ\.2 \@(?P<zone>\d+)\,(?P<power>[01])'),
+                re.compile(r'\^\=VPZ\.2 \@(?P<zone>\d+)\,(?P<volume>\d+)'),
+                re.compile(r'\^\=MZ\.2 \@(?P<zone>\d+)\,(?P<mute>[01])'),
+                re.compile(r'\^\=SZ\.2 \@(?P<zone>\d+)\,(?P<source>\d+)') ]
+
+
+def regex_parse(message):
+    for regexp in ZONE_REGEXP:
+        match = regexp.match(message)
+        if match:
+            match_dict = match.groupdict()
+            for key in match_dict.keys():
+                if key == 'power' or key == 'mute':
+                    match_dict[key] = bool(int(match_dict[key]))
+                else:
+                    match_dict[key] = int(match_dict[key])
+            return match_dict
+    return None
+
+
+def sample_lines(zones=32):
+    lines = []
+    for zone in range(1, zones + 1):
+        lines.append(f'^=PZ.2 @{zone},1$')
+        lines.append(f'^=VPZ.2 @{zone},{zone + 20}$')
+        lines.append(f'^=MZ.2 @{zone},0$')
+        lines.append(f'^=SZ.2 @{zone},{zone % 8 + 1}$')
+    lines.append('^+$')  # Unrecognised acknowledgement
+    return lines
+
+
+def lines_per_second(parse, lines, rounds=2000):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for line in lines:
+            parse(line)
+    return rounds * len(lines) / (time.perf_counter() - start)
+
+
+def run(rounds=2000):
+    lines = sample_lines()
+    return {
+        'regex_cascade': lines_per_second(regex_parse, lines, rounds),
+        'dispatch_table': lines_per_second(PARSER.parse, lines, rounds),
+    }
+
+
+if __name__ == '__main__':
+    results = run()
+    for name, rate in results.items():
+        print(f'{name:>16}: {rate:12,.0f} lines/s')
+    print(f'{"speedup":>16}: {results["dispatch_table"] / results["regex_cascade"]:12.2f}x')
@@ -0,0 +1,48 @@
+"""Measure status sweeps across several matrices sharing one event loop.
+
+Each simulated matrix is acquired twice through the shared registry, so
+only one socket per matrix should be opened.
+
+Usage: python -m benchmarks.registry
+"""
+import asyncio
+import logging
+import time
+
+from pyp8 import async_acquire_amp_controller, async_close_amp_controllers
+from pyp8.simulator import MatrixSimulator
+
+ZONES = 32
+
+
+async def sweep(amps, zones=ZONES):
+    start = time.perf_counter()
+    results = await asyncio.gather(*(amp.get_status_many(range(1, zones + 1)) for amp in amps))
+    elapsed = time.perf_counter() - start
+    replies = sum(len(fields) for result in results for fields in result.values())
+    return elapsed, replies
+
+
+async def run(counts=(1, 2, 4, 8, 16)):
+    results = []
+    for count in counts:
+        simulators = [MatrixSimulator(zones=ZONES) for _ in range(count)]
+        amps = []
+        for simulator in simulators:
+            port = await simulator.start()
+            amps.append(await async_acquire_amp_controller('127.0.0.1', port))
+            await async_acquire_amp_controller('127.0.0.1', port)    # Shared, no new socket
+
+        elapsed, replies = await sweep(amps)
+        results.append({'amps': count, 'seconds': elapsed, 'replies_per_second': replies / elapsed})
+
+        await async_close_amp_controllers()
+        for simulator in simulators:
+            await simulator.stop()
+    return results
+
+
+if __name__ == '__main__':
+    logging.disable(logging.INFO)
+    for result in asyncio.run(run()):
+        print(f'{result["amps"]:3d} amps: {result["seconds"]:.3f}s, {result["replies_per_second"]:10,.0f} replies/s')
@@ -0,0 +1,68 @@
+"""Measure what each matrix costs Home Assistant at startup.
+
+Import time is measured in fresh interpreters, both cold and with asyncio
+already loaded as it always is under Home Assistant. Construction creates
+controllers without connecting, and connect brings several simulated
+matrices up concurrently.
+
+Usage: python -m benchmarks.startup
+"""
+import asyncio
+import logging
+import statistics
+import subprocess
+import sys
+import time
+
+from pyp8 import AmpControlAsync
+from pyp8.simulator import MatrixSimulator
+
+IMPORT_RUNS = 10
+
+
+def import_seconds(setup='', runs=IMPORT_RUNS):
+    """Median seconds to import pyp8 in a new interpreter, after running setup."""
+    code = f'{setup}\nimport time\nstart = time.perf_counter()\nimport pyp8\nprint(time.perf_counter() - start)'
+    samples = [
+        float(subprocess.run([sys.executable, '-c', code], capture_output=True, check=True, text=True).stdout)
+        for _ in range(runs)
+    ]
+    return statistics.median(samples)
+
+
+async def construction_seconds(count=1000):
+    """Mean seconds to create one controller, without connecting it."""
+    start = time.perf_counter()
+    for i in range(count):
+        AmpControlAsync('127.0.0.1', 50005 + i)
+    return (time.perf_counter() - start) / count
+
+
+async def connect_seconds(count=16):
+    """Seconds until count matrices are all connected, started concurrently."""
+    simulators = [MatrixSimulator(zones=32) for _ in range(count)]
+    ports = [await simulator.start() for simulator in simulators]
+    start = time.perf_counter()
+    amps = [AmpControlAsync('127.0.0.1', port) for port in ports]
+    await asyncio.gather(*(amp.connect() for amp in amps))
+    elapsed = time.perf_counter() - start
+    for amp in amps:
+        await amp.close()
+    for simulator in simulators:
+        await simulator.stop()
+    return elapsed
+
+
+async def run():
+    return {
+        'import_ms': import_seconds() * 1000,
+        'import_after_asyncio_ms': import_seconds('import asyncio') * 1000,
+        'construct_us': await construction_seconds() * 1e6,
+        'connect_16_amps_ms': await connect_seconds() * 1000,
+    }
+
+
+if __name__ == '__main__':
+    logging.disable(logging.INFO)
+    for name, value in asyncio.run(run()).items():
+        print(f'{name:>24}: {value:10.3f}')
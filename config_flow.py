@@ -0,0 +1,53 @@
+import asyncio
+import logging
+
+import voluptuous as vol
+from homeassistant import config_entries
+from homeassistant.const import CONF_HOST, CONF_NAME, CONF_PORT
+
+from . import label_cache_path
+from .const import DEFAULT_NAME, DEFAULT_PORT, DOMAIN, PROBE_TIMEOUT
+from .pyp8 import async_get_amp_controller
+from .pyp8.labels import async_get_labels
+
+LOG = logging.getLogger(__name__)
+
+USER_SCHEMA = vol.Schema(
+    {
+        vol.Required(CONF_NAME, default=DEFAULT_NAME): str,
+        vol.Required(CONF_HOST): str,
+        vol.Required(CONF_PORT, default=DEFAULT_PORT): int,
+    }
+)
+
+
+class PulseEightConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
+    """Add a matrix from the UI."""
+
+    VERSION = 1
+
+    async def async_step_user(self, user_input=None):
+        errors = {}
+        if user_input is not None:
+            host = user_input[CONF_HOST]
+            port = user_input[CONF_PORT]
+            await self.async_set_unique_id(f'{host}:{port}')
+            self._abort_if_unique_id_configured()
+            try:
+                await self._async_probe(host, port)
+            except asyncio.TimeoutError:
+                errors['base'] = 'cannot_connect'
+            else:
+                return self.async_create_entry(title=user_input[CONF_NAME], data=user_input)
+
+        return self.async_show_form(step_id='user', data_schema=USER_SCHEMA, errors=errors)
+
+    async def _async_probe(self, host, port):
+        """Check the matrix answers and cache its labels, so setup has names without waiting."""
+        amp = await async_get_amp_controller(host, port)
+        try:
+            await asyncio.wait_for(amp.connect(), PROBE_TIMEOUT)
+            labels = await async_get_labels(amp, label_cache_path(self.hass, host, port))
+            LOG.info(f'Found {len(labels["zones"])} zones and {len(labels["sources"])} sources on {host}:{port}')
+        finally:
+            await amp.close()
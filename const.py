@@ -1 +1,16 @@
 DOMAIN = 'pulse_eight'
+
+PLATFORMS = ['media_player', 'sensor']
+
+CONF_SOURCES = 'sources'
+CONF_ZONES = 'zones'
+
+DEFAULT_NAME = 'ProAudio'
+DEFAULT_PORT = 50005
+PROBE_TIMEOUT = 10  # Seconds the config flow waits to reach the matrix
+
+SERVICE_SNAPSHOT = 'snapshot'
+SERVICE_RESTORE = 'restore'
+SERVICE_RAMP_VOLUME = 'ramp_volume'
+
+ATTR_DURATION = 'duration'
@@ -1,23 +1,22 @@
 import logging
 import asyncio
 
-from .pyp8 import async_get_amp_controller
+from .pyp8 import async_acquire_amp_controller, async_release_amp_controller
+from .pyp8.labels import async_get_labels, load_cache
+from .pyp8.events import COALESCE
+from .pyp8.protocol import MAX_ZONES as MATRIX_ZONES, SCENE_FIELDS, TONE_FIELDS
 
 import voluptuous as vol
-from ratelimit import limits
 from homeassistant.components.media_player import PLATFORM_SCHEMA, MediaPlayerEntity, MediaPlayerEntityFeature
 from homeassistant.components.media_player.const import (
-    SUPPORT_SELECT_SOURCE,
-    SUPPORT_TURN_OFF,
-    SUPPORT_TURN_ON,
-    SUPPORT_VOLUME_MUTE,
-    SUPPORT_VOLUME_SET,
-    SUPPORT_VOLUME_STEP,
+    ATTR_MEDIA_VOLUME_LEVEL,
 )
-from homeassistant.helpers import config_validation as cv
+from homeassistant.helpers import config_validation as cv, entity_platform
+from homeassistant.helpers.discovery import async_load_platform
 from homeassistant.const import (
     ATTR_ENTITY_ID,
     CONF_ENTITY_NAMESPACE,
+    EVENT_HOMEASSISTANT_STOP,
     CONF_NAME,
     CONF_PORT,
     CONF_TYPE,
@@ -26,21 +25,30 @@ from homeassistant.const import (
     STATE_UNKNOWN,
 )
 
+from . import label_cache_path
 from .const import (
+    ATTR_DURATION,
+    CONF_SOURCES,
+    CONF_ZONES,
+    DEFAULT_NAME,
+    DEFAULT_PORT,
     DOMAIN,
+    SERVICE_RAMP_VOLUME,
+    SERVICE_RESTORE,
+    SERVICE_SNAPSHOT,
 #    SERVICE_JOIN,
 #    SERVICE_UNJOIN,
 )
 
 LOG = logging.getLogger(__name__)
 
-CONF_SOURCES = 'sources'
-CONF_ZONES = 'zones'
 CONF_HOST = 'host'
 MAX_ZONES = 32
 MINUTES = 60
 MAX_VOLUME = 100
 VOL_INCREMENT = 2
+STATE_WRITE_WINDOW = 0.05   # Seconds to collect status changes into one state write
+AGGREGATE_FIELDS = ('power', 'volume', 'mute')   # Zone fields the all zones player combines
 
 SUPPORTED_ZONE_FEATURES = (
     MediaPlayerEntityFeature.VOLUME_MUTE
@@ -65,60 +73,196 @@ ZONE_SCHEMA = vol.Schema(
 
 PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend(
     {
-        vol.Optional(CONF_NAME, default='ProAudio'): cv.string,
+        vol.Optional(CONF_NAME, default=DEFAULT_NAME): cv.string,
         vol.Required(CONF_HOST): cv.string,
-        vol.Required(CONF_PORT, default=50005): cv.positive_int,
-        vol.Required(CONF_ZONES): vol.Schema({ZONE_IDS: ZONE_SCHEMA}),
-        vol.Required(CONF_SOURCES): vol.Schema({SOURCE_IDS: SOURCE_SCHEMA}),
+        vol.Required(CONF_PORT, default=DEFAULT_PORT): cv.positive_int,
+        # Zones and sources left out are discovered from the matrix
+        vol.Optional(CONF_ZONES): vol.Schema({ZONE_IDS: ZONE_SCHEMA}),
+        vol.Optional(CONF_SOURCES): vol.Schema({SOURCE_IDS: SOURCE_SCHEMA}),
     }
 )
 async def async_setup_platform(hass, config, async_add_entities, discovery_info=None):
-    namespace = config.get(CONF_ENTITY_NAMESPACE)
     amp_name = config.get(CONF_NAME)
-    entities = []
-    
+    host = config[CONF_HOST]
+    port = config[CONF_PORT]
+
     LOG.debug('Setting up ProAudio platform')
 
-    async def status_cb(message):
-        #LOG.debug(f"Callback in integration with message: {message}")
-        zone = message.get('zone')
-        if zone is not None:
-            zone_id = zone
-            LOG.debug(f'Updating zone {zone_id} status: {message}')
-            if zone_id in Zones.keys():
-                await Zones[zone_id].update_status(message)
-                await HMP.update_status(message)
-            else:
-                LOG.warning(f'Unknown zone "{zone_id}" of type {type(zone_id)} in message: {message}')
-            
-    
+    amp = await async_acquire_amp_controller(host, port, wait=False)
+
+    async def release_amp(event):
+        remove()
+        await async_release_amp_controller(amp)
 
-    amp = await async_get_amp_controller(config[CONF_HOST], config[CONF_PORT], status_cb=status_cb)
-    await amp.connect()
+    hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, release_amp)
 
+    zone_names = {
+        zone_id: extra[CONF_NAME] for zone_id, extra in config.get(CONF_ZONES, {}).items()
+    }
     sources = {
-        source_id: extra[CONF_NAME] for source_id, extra in config[CONF_SOURCES].items()
+        source_id: extra[CONF_NAME] for source_id, extra in config.get(CONF_SOURCES, {}).items()
     }
 
+    # Connection metrics and source routing are exposed by sensors
+    hass.data.setdefault(DOMAIN, {})[(host, port)] = amp
+    hass.async_create_task(async_load_platform(
+        hass, 'sensor', DOMAIN,
+        {CONF_NAME: amp_name, CONF_HOST: host, CONF_PORT: port, CONF_SOURCES: sources}, config,
+    ))
+    remove = await async_setup_matrix(
+        hass, amp, amp_name, config.get(CONF_ENTITY_NAMESPACE), zone_names, sources,
+        label_cache_path(hass, host, port), async_add_entities,
+    )
+    register_services()
+
+
+async def async_setup_entry(hass, entry, async_add_entities):
+    amp = hass.data[DOMAIN][entry.entry_id]
+    remove = await async_setup_matrix(
+        hass, amp, entry.data[CONF_NAME], None, {}, {},
+        label_cache_path(hass, entry.data[CONF_HOST], entry.data[CONF_PORT]), async_add_entities,
+        unique_key=entry.entry_id,
+    )
+    entry.async_on_unload(remove)
+    register_services()
+
+
+async def async_setup_matrix(hass, amp, amp_name, namespace, zone_names, sources, cache, async_add_entities,
+                             unique_key=None):
+    """Add the entities of a matrix without waiting for it to connect.
+
+    Unique IDs are built from unique_key when given, e.g. a config entry ID,
+    otherwise from the matrix name. Zones and sources not given are named
+    from the label cache. Connecting,
+    label discovery when nothing is cached and the initial status sweep run
+    in the background, entities are unavailable until the matrix connects.
+    Returns a function undoing the subscriptions made here.
+    """
     Zones = {}
-    for zone_id, extra in config[CONF_ZONES].items():
-        ZMP = ZoneMediaPlayer(namespace, amp_name, amp, sources, zone_id, extra[CONF_NAME])
-        Zones[zone_id] = ZMP
-        entities.append(ZMP)
+    entities = []
+    scheduler = StateWriteScheduler(hass)
+
+    async def consume_events():
+        async for message in events:
+            zone_id = message.zone
+            LOG.debug('Updating zone %s status: %s', zone_id, message)
+            # The matrix may be shared with other platforms owning other zones
+            if zone_id in Zones.keys():
+                Zones[zone_id].update_status(message)
+                HMP.update_status(message)
+                scheduler.mark(Zones[zone_id])
+                scheduler.mark(HMP)
+
+    def connection_cb(connected):
+        LOG.info(f'{amp_name} {"connected" if connected else "disconnected"}')
+        for entity in entities:
+            scheduler.mark(entity)
+
+    def add_entities(zone_names, sources):
+        nonlocal HMP
+        sources = SourceNames(sources)
+        for zone_id, zone_name in zone_names.items():
+            ZMP = ZoneMediaPlayer(namespace, amp_name, amp, sources, zone_id, zone_name, unique_key)
+            Zones[zone_id] = ZMP
+            entities.append(ZMP)
+
+        HMP = HomeMediaPlayer(namespace, amp_name, amp, sources, Zones, unique_key)
+        entities.append(HMP)
+        async_add_entities(entities)
+
+    async def start():
+        await amp.connect()
+        if discover:
+            # Discover the labels when not cached, or check the cache is still current
+            labels = await async_get_labels(amp, cache)
+            if not entities:
+                add_entities(zone_names or labels['zones'], sources or labels['sources'])
+
+        # Get status of every zone in one burst
+        await amp.get_status_many(Zones.keys())
+
+        # Catch changes the matrix does not push, e.g. from keypads
+        amp.start_polling()
+
+    def remove():
+        task.cancel()
+        consumer.cancel()
+        events.close()
+        amp.unsubscribe_connection(connection_cb)
+
+    HMP = None
+    # Merged changes carry the latest value of a field, which is all the players apply
+    events = amp.events(maxsize=MATRIX_ZONES * len(SCENE_FIELDS), overflow=COALESCE)
+    consumer = hass.async_create_background_task(consume_events(), f'{DOMAIN} {amp_name} events')
+    amp.subscribe_connection(connection_cb)
+
+    discover = not zone_names or not sources
+    if discover:
+        cached = await hass.async_add_executor_job(load_cache, cache)
+        if cached is not None:
+            zone_names = zone_names or cached['zones']
+            sources = sources or cached['sources']
+    if zone_names and sources:
+        add_entities(zone_names, sources)
+
+    task = hass.async_create_background_task(start(), f'{DOMAIN} {amp_name} startup')
+    return remove
+
+
+def register_services():
+    platform = entity_platform.async_get_current_platform()
+    platform.async_register_entity_service(SERVICE_SNAPSHOT, {}, 'async_snapshot')
+    platform.async_register_entity_service(SERVICE_RESTORE, {}, 'async_restore')
+    platform.async_register_entity_service(
+        SERVICE_RAMP_VOLUME,
+        {
+            vol.Required(ATTR_MEDIA_VOLUME_LEVEL): cv.small_float,
+            vol.Required(ATTR_DURATION): vol.All(vol.Coerce(float), vol.Range(min=0)),
+        },
+        'async_ramp_volume',
+    )
+
+class SourceNames:
+    """Source ID to name and name to ID maps, shared by the entities of a matrix."""
+
+    def __init__(self, names):
+        self.by_id = dict(names)    # [source_id]   -> source name
+        self.by_name = {name: source_id for source_id, name in names.items()}  # [source name] -> source_id
+        # TODO: Ideally the source order could be overridden in YAML config (e.g. TV should appear first on list).
+        #       Optionally, we could just sort based on the zone number, and let the user physically wire in the
+        #       order they want (doesn't work for pre-amp out channel 7/8 on some Xantech)
+        self.names = sorted(self.by_name, key=self.by_name.get)
+
+
+class StateWriteScheduler:
+    """Write the state of entities changed within a short window once each.
 
-    HMP = HomeMediaPlayer(namespace, amp_name, amp, sources, Zones)
-    entities.append(HMP)
+    A zone sweep reports several fields per zone and every report touches the
+    home player too, so writing state per report floods the state machine.
+    """
 
-    async_add_entities(entities, True)
+    def __init__(self, hass, window=STATE_WRITE_WINDOW):
+        self._hass = hass
+        self._window = window
+        self._dirty = {}    # Entities to write, used as an ordered set
+        self._handle = None
 
-    # Get status of each zone
-    for zone in Zones.values():
-        await zone.get_status()
+    def mark(self, entity):
+        self._dirty[entity] = None
+        if self._handle is None:
+            self._handle = self._hass.loop.call_later(self._window, self._flush)
+
+    def _flush(self):
+        self._handle = None
+        dirty, self._dirty = self._dirty, {}
+        for entity in dirty:
+            if entity.hass is not None:     # Not written until added to HA
+                entity.async_write_ha_state()
 
 class ZoneMediaPlayer(MediaPlayerEntity):
     """Representation of a matrix amplifier zone."""
 
-    def __init__(self, namespace, amp_name, amp, sources, zone_id, zone_name):
+    def __init__(self, namespace, amp_name, amp, sources, zone_id, zone_name, unique_key=None):
         """Initialize new zone."""
         self._amp = amp
         self._amp_name = amp_name
@@ -127,47 +271,35 @@ class ZoneMediaPlayer(MediaPlayerEntity):
 
         # FIXME: since this should be a logical media player...why is it not good enough for the user
         # specified name to represent this?  Other than it could be changed...
-        self._unique_id = f'{DOMAIN}_{amp_name}_zone_{zone_id}'.lower().replace(
+        self._unique_id = f'{DOMAIN}_{unique_key or amp_name}_zone_{zone_id}'.lower().replace(
             ' ', '_'
         )
 
         LOG.info(f'Creating {self.zone_info} media player')
 
-        self._status = {}
         self._status_snapshot = None
 
-        self._source = None
-        self._source_id_to_name = sources  # [source_id]   -> source name
-        self._source_name_to_id = {
-            v: k for k, v in sources.items()
-        }  # [source name] -> source_id
-
-        # sort list of source names
-        self._source_names = sorted(
-            self._source_name_to_id.keys(), key=lambda v: self._source_name_to_id[v]
-        )
-        # TODO: Ideally the source order could be overridden in YAML config (e.g. TV should appear first on list).
-        #       Optionally, we could just sort based on the zone number, and let the user physically wire in the
-        #       order they want (doesn't work for pre-amp out channel 7/8 on some Xantech)
+        self._sources = sources
 
        
-    async def update_status(self, status):
+    def update_status(self, delta):
+        """Apply a StatusDelta for this zone, the amp state table already holds the new value."""
         #LOG.debug('Updating status')
-        self._status.update(status)
-
-        source_id = status.get('source')
-        if source_id:
-            source_name = self._source_id_to_name.get(source_id)
-            if source_name:
-                self._source = source_name
-            else:
-                LOG.warning(f'Unknown source ID {source_id} for {self.zone_info}')
-
-        self.async_schedule_update_ha_state()
+        if delta.field == 'source' and delta.new not in self._sources.by_id:
+            LOG.warning(f'Unknown source ID {delta.new} for {self.zone_info}')
 
     async def async_update(self):
         pass
 
+    @property
+    def should_poll(self):
+        """State is pushed by the amp, which also polls the matrix for drift."""
+        return False
+
+    @property
+    def available(self):
+        return self._amp.connected
+
     @property
     def zone_info(self):
         return f'{self._amp_name} zone {self._zone_id} ({self._name})'
@@ -185,7 +317,7 @@ class ZoneMediaPlayer(MediaPlayerEntity):
     @property
     def state(self):
         """Return the powered on state of the zone."""
-        power = self._status.get('power')
+        power = self._amp.state.get(self._zone_id, 'power')
         if power is not None and power is True:
             return STATE_ON
         else:
@@ -194,16 +326,26 @@ class ZoneMediaPlayer(MediaPlayerEntity):
     @property
     def volume_level(self):
         """Volume level of the media player (0..1)."""
-        volume = self._status.get('volume')
+        volume = self._amp.state.get(self._zone_id, 'volume')
         if volume is None:
             return None
         return volume / MAX_VOLUME
 
+    @property
+    def extra_state_attributes(self):
+        """Bass, treble and balance, where the matrix has reported them."""
+        state = self._amp.state
+        return {
+            field: state.get(self._zone_id, field)
+            for field in TONE_FIELDS
+            if state.get(self._zone_id, field) is not None
+        }
+
     @property
     def is_volume_muted(self):
         """Boolean if volume is currently muted."""
         # FIXME: what about when volume == 0?
-        mute = self._status.get('mute')
+        mute = self._amp.state.get(self._zone_id, 'mute')
         if mute is None:
             mute = False
         return mute
@@ -216,39 +358,39 @@ class ZoneMediaPlayer(MediaPlayerEntity):
     @property
     def source(self):
         """Return the current input source of the device."""
-        return self._source
+        return self._sources.by_id.get(self._amp.routing.source(self._zone_id))
 
     @property
     def source_list(self):
         """List of available input sources."""
-        return self._source_names
+        return self._sources.names
 
     async def async_select_source(self, source):
         """Set input source."""
-        if source not in self._source_name_to_id:
+        if source not in self._sources.by_name:
             LOG.warning(
-                f"Selected source '{source}' not valid for {self.zone_info}, ignoring! Sources: {self._source_name_to_id}"
+                f"Selected source '{source}' not valid for {self.zone_info}, ignoring! Sources: {self._sources.names}"
             )
             return
 
-        source_id = self._source_name_to_id[source]
+        source_id = self._sources.by_name[source]
         LOG.info(f'Switching {self.zone_info} to source {source_id} ({source})')
-        await self._amp.set_source(self._zone_id, source_id)
+        await self._confirm(self._amp.set_source, source_id)
 
     async def async_turn_on(self):
         """Turn the media player on."""
         LOG.debug(f'Turning ON {self.zone_info}')
-        await self._amp.set_power(self._zone_id, True)
+        await self._confirm(self._amp.set_power, True)
 
     async def async_turn_off(self):
         """Turn the media player off."""
         LOG.debug(f'Turning OFF {self.zone_info}')
-        await self._amp.set_power(self._zone_id, False)
+        await self._confirm(self._amp.set_power, False)
 
     async def async_mute_volume(self, mute):
         """Mute (true) or unmute (false) media player."""
         LOG.debug(f'Setting mute={mute} for zone {self.zone_info}')
-        await self._amp.set_mute(self._zone_id, mute)
+        await self._confirm(self._amp.set_mute, mute)
 
     async def async_set_volume_level(self, volume):
         """Set volume level, range 0—1.0"""
@@ -256,20 +398,43 @@ class ZoneMediaPlayer(MediaPlayerEntity):
         LOG.debug(
             f'Setting zone {self.zone_info} volume to {amp_volume} (HA volume {volume}'
         )
-        await self._amp.set_volume(self._zone_id, amp_volume)
+        await self._confirm(self._amp.set_volume, amp_volume)
 
     async def async_volume_up(self):
         LOG.debug(f'Volume up for zone {self.zone_info}')
-        await self._amp.volume_up(self._zone_id, VOL_INCREMENT)
+        await self._confirm(self._amp.volume_up, VOL_INCREMENT)
 
     async def async_volume_down(self):
         LOG.debug(f'Volume down for zone {self.zone_info}')
-        await self._amp.volume_down(self._zone_id, VOL_INCREMENT)
+        await self._confirm(self._amp.volume_down, VOL_INCREMENT)
 
     async def get_status(self):
         LOG.debug(f'Getting status for zone {self.zone_info}')
         await self._amp.get_status(self._zone_id)
 
+    async def async_ramp_volume(self, volume_level, duration):
+        """Fade to a volume level (0..1) over duration seconds."""
+        LOG.debug(f'Ramping {self.zone_info} to volume {volume_level} over {duration}s')
+        await self._amp.ramp_volume([self._zone_id], int(volume_level * MAX_VOLUME), duration)
+
+    async def async_snapshot(self):
+        """Remember the zone's power, volume, mute and source."""
+        self._status_snapshot = self._amp.snapshot([self._zone_id])
+
+    async def async_restore(self):
+        """Return the zone to the last snapshot."""
+        if self._status_snapshot is None:
+            LOG.warning(f'No snapshot to restore for {self.zone_info}')
+            return
+        await self._amp.restore(self._status_snapshot)
+
+    async def _confirm(self, setter, *args):
+        """Run an amp setter and wait for the matrix to confirm the change."""
+        try:
+            await setter(self._zone_id, *args, confirm=True)
+        except asyncio.TimeoutError:
+            LOG.warning(f'{self.zone_info} did not confirm the change')
+
     @property
     def icon(self):
         if self.state == STATE_OFF:
@@ -279,39 +444,70 @@ class ZoneMediaPlayer(MediaPlayerEntity):
 class HomeMediaPlayer(MediaPlayerEntity):
     """ Controls all zones"""
 
-    def __init__(self, namespace, name, amp, sources, zone_players):
+    def __init__(self, namespace, name, amp, sources, zone_players, unique_key=None):
         self._name = name
         self._amp = amp
         self._amp_name = name
         self._zones = zone_players
-        self._zone_id = ',@'.join([str(z) for z in self._zones.keys()]) # Convert to string common separated
-        LOG.debug(f'Zone list for all {self._zone_id}')
+        self._zone_ids = list(self._zones.keys())
+        LOG.debug(f'Zone list for all {self._zone_ids}')
         self._status = {}
         self._status['power'] = True
-        self._source = None
 
-        self._source_id_to_name = sources  # [source_id]   -> source name
-        self._source_name_to_id = {
-            v: k for k, v in sources.items()
-        }  # [source name] -> source_id
-
-        # sort list of source names
-        self._source_names = sorted(
-            self._source_name_to_id.keys(), key=lambda v: self._source_name_to_id[v]
-        )
-        # TODO: Ideally the source order could be overridden in YAML config (e.g. TV should appear first on list).
-        #       Optionally, we could just sort based on the zone number, and let the user physically wire in the
-        #       order they want (doesn't work for pre-amp out channel 7/8 on some Xantech)
+        # Running aggregates over the zones, updated from each zone status change
+        self._powered = 0           # Zones switched on
+        self._volume_sum = 0        # Sum of known volumes of zones switched on
+        self._volume_count = 0
+        self._unmuted = len(zone_players)
+        # Status per zone as of the last delta applied, amp.state may be ahead
+        self._zone_status = {}
+        self._status_snapshot = None
 
-        self._unique_id = f'{DOMAIN}_{namespace}_{name}'.lower().replace(' ', '_')
+        self._sources = sources
+
+        self._unique_id = f'{DOMAIN}_{unique_key or namespace}_{name}'.lower().replace(' ', '_')
+
+        # A shared controller may already be synced, start from what it knows.
+        # Deltas still queued for us then replay on top and end at the same values.
+        for zone in self._zone_ids:
+            status = self._zone_status[zone] = {
+                field: value for field, value in amp.state.zone(zone).items()
+                if field in AGGREGATE_FIELDS
+            }
+            self._account(status, 1)
+
+    def _account(self, status, sign):
+        """Add (sign 1) or remove (sign -1) one zone's status from the aggregates."""
+        if status.get('power') is True:
+            self._powered += sign
+            volume = status.get('volume')
+            if volume is not None:
+                self._volume_sum += sign * volume
+                self._volume_count += sign
+        if status.get('mute') is True:
+            self._unmuted -= sign
+
+    def update_status(self, delta):
+        """Update the aggregates from a StatusDelta of one zone."""
+        if delta.field not in AGGREGATE_FIELDS:
+            return
+        status = self._zone_status.setdefault(delta.zone, {})
+        self._account(status, -1)
+        status[delta.field] = delta.new
+        self._account(status, 1)
 
+    @property
+    def zone_info(self):
+        return f'{self._amp_name} zones {self._zone_ids} ({self._name})'
 
-    async def update_status(self, status):
-        self.async_schedule_update_ha_state()
+    @property
+    def should_poll(self):
+        """State is aggregated from the zone updates pushed by the amp."""
+        return False
 
     @property
-    def zone_info(self):
-        return f'{self._amp_name} zone {self._zone_id} ({self._name})'
+    def available(self):
+        return self._amp.connected
 
     @property
     def unique_id(self):
@@ -326,31 +522,19 @@ class HomeMediaPlayer(MediaPlayerEntity):
     @property
     def state(self):
         """Return the powered on state of the zone."""
-        for z in self._zones:
-            if self._zones[z].state == STATE_ON:
-                return STATE_ON
-        return STATE_OFF # If one zone is on, on.  If all are off, off.
+        return STATE_ON if self._powered else STATE_OFF # If one zone is on, on.  If all are off, off.
 
     @property
     def volume_level(self):
-        """Volume level of the media player (0..1)."""
-        sum = 0
-        ii = 0
-        for zone in self._zones:
-            if self._zones[zone].state == STATE_ON:
-                volume = self._zones[zone].volume_level
-                if volume is not None:
-                    sum += volume
-                    ii += 1
-        return (sum/ii) if ii > 0 else 0
+        """Average volume level of the zones switched on (0..1)."""
+        if not self._volume_count:
+            return 0
+        return self._volume_sum / self._volume_count / MAX_VOLUME
 
     @property
     def is_volume_muted(self):
-        """Boolean if volume is currently muted."""
-        for z in self._zones:
-            if self._zones[z].is_volume_muted == False:
-                return False
-        return True
+        """Boolean if every zone is muted."""
+        return self._unmuted == 0
 
     @property
     def supported_features(self):
@@ -359,40 +543,40 @@ class HomeMediaPlayer(MediaPlayerEntity):
 
     @property
     def source(self):
-        """Return the current input source of the device."""
-        return self._source
+        """Return the source every zone is switched to, None if they differ."""
+        return self._sources.by_id.get(self._amp.routing.shared_source(self._zone_ids))
 
     @property
     def source_list(self):
         """List of available input sources."""
-        return self._source_names
+        return self._sources.names
 
     async def async_select_source(self, source):
         """Set input source."""
-        if source not in self._source_name_to_id:
+        if source not in self._sources.by_name:
             LOG.warning(
-                f"Selected source '{source}' not valid for {self.zone_info}, ignoring! Sources: {self._source_name_to_id}"
+                f"Selected source '{source}' not valid for {self.zone_info}, ignoring! Sources: {self._sources.names}"
             )
             return
 
-        source_id = self._source_name_to_id[source]
+        source_id = self._sources.by_name[source]
         LOG.info(f'Switching {self.zone_info} to source {source_id} ({source})')
-        await self._amp.set_source(self._zone_id, source_id)
+        await self._amp.set_source_many(dict.fromkeys(self._zone_ids, source_id))
 
     async def async_turn_on(self):
         """Turn the media player on."""
         LOG.debug(f'Turning ON {self.zone_info}')
-        await self._amp.set_power(self._zone_id, True)
+        await self._amp.set_power_many(self._zone_ids, True)
 
     async def async_turn_off(self):
         """Turn the media player off."""
         LOG.debug(f'Turning OFF {self.zone_info}')
-        await self._amp.set_power(self._zone_id, False)
+        await self._amp.set_power_many(self._zone_ids, False)
 
     async def async_mute_volume(self, mute):
         """Mute (true) or unmute (false) media player."""
         LOG.debug(f'Setting mute={mute} for zone {self.zone_info}')
-        await self._amp.set_mute(self._zone_id, mute)
+        await self._amp.set_mute_many(self._zone_ids, mute)
 
     async def async_set_volume_level(self, volume):
         """Set volume level, range 0—1.0"""
@@ -400,15 +584,31 @@ class HomeMediaPlayer(MediaPlayerEntity):
         LOG.debug(
             f'Setting zone {self.zone_info} volume to {amp_volume} (HA volume {volume}'
         )
-        await self._amp.set_volume(self._zone_id, amp_volume)
+        await self._amp.set_volume_many(dict.fromkeys(self._zone_ids, amp_volume))
 
     async def async_volume_up(self):
         LOG.debug(f'Volume up for zone {self.zone_info}')
-        await self._amp.volume_up(self._zone_id, VOL_INCREMENT)
+        await self._amp.volume_up_many(self._zone_ids, VOL_INCREMENT)
 
     async def async_volume_down(self):
         LOG.debug(f'Volume down for zone {self.zone_info}')
-        await self._amp.volume_down(self._zone_id, VOL_INCREMENT)
+        await self._amp.volume_down_many(self._zone_ids, VOL_INCREMENT)
+
+    async def async_ramp_volume(self, volume_level, duration):
+        """Fade every zone to a volume level (0..1) over duration seconds."""
+        LOG.debug(f'Ramping {self.zone_info} to volume {volume_level} over {duration}s')
+        await self._amp.ramp_volume(self._zone_ids, int(volume_level * MAX_VOLUME), duration)
+
+    async def async_snapshot(self):
+        """Remember power, volume, mute and source of every zone."""
+        self._status_snapshot = self._amp.snapshot(self._zone_ids)
+
+    async def async_restore(self):
+        """Return every zone to the last snapshot in one burst."""
+        if self._status_snapshot is None:
+            LOG.warning(f'No snapshot to restore for {self.zone_info}')
+            return
+        await self._amp.restore(self._status_snapshot)
 
     @property
     def icon(self):
@@ -1,59 +1,359 @@
 import asyncio
+import collections
+import itertools
 import socket
 import logging
+import random
+import time
+
+from .metrics import Metrics
 
 LOG = logging.getLogger(__name__)
-logging.basicConfig(level=logging.DEBUG)
+
+FRAME_DELIMITER = b'\r\n'
+MAX_FRAME = 1024
+WRITE_INTERVAL = 0.05   # Seconds between socket writes
+MAX_WRITE = 4096        # Bytes of queued commands merged into one write
+MAX_IN_FLIGHT = 32      # Commands sent but not yet answered
+ACK_TIMEOUT = 1.0       # Seconds before unanswered commands are written off
+HIGH_WATER = 256        # Queued commands at which backpressure is applied
+LOW_WATER = 64          # Queued commands at which backpressure is released
+RECONNECT_MIN_DELAY = 0.05  # Seconds before the first reconnect attempt
+OUTAGE_BUFFER = 30      # Seconds queued commands are kept while disconnected
+CONNECT_TIMEOUT = 5     # Seconds to wait for a connection attempt
+
+
+class LineFramer:
+    """Incrementally split a byte stream into delimiter terminated frames.
+
+    Data is accumulated in a single persistent buffer. Each feed only scans the
+    newly received bytes (plus the tail that could hold a split delimiter), so
+    a burst of replies arriving across many reads is never re-scanned.
+    """
+
+    def __init__(self, max_frame=MAX_FRAME, delimiter=FRAME_DELIMITER):
+        self.max_frame = max_frame
+        self.delimiter = delimiter
+        self.partial_frames = 0     # Reads that ended part way through a frame
+        self.oversized_frames = 0   # Frames dropped for exceeding max_frame
+        self._buffer = bytearray()
+        self._scanned = 0           # Bytes of _buffer already searched for the delimiter
+        self._discarding = False    # Dropping the remainder of an oversized frame
+
+    def feed(self, data):
+        """Add received bytes and return the list of complete frames."""
+        buffer = self._buffer
+        buffer += data
+        delimiter = self.delimiter
+        skip = len(delimiter)
+        frames = []
+        start = 0
+        pos = max(self._scanned - skip + 1, 0)
+        while True:
+            end = buffer.find(delimiter, pos)
+            if end < 0:
+                break
+            if self._discarding:
+                self._discarding = False
+            elif end - start > self.max_frame:
+                self.oversized_frames += 1
+            elif end > start:
+                frames.append(bytes(buffer[start:end]))
+            start = pos = end + skip
+
+        if start:
+            del buffer[:start]
+
+        if len(buffer) > self.max_frame:
+            # No delimiter in sight, drop what we have but keep enough of the
+            # tail to recognise a delimiter split across reads.
+            if not self._discarding:
+                self.oversized_frames += 1
+                self._discarding = True
+            del buffer[:-(skip - 1) or len(buffer)]
+
+        if buffer:
+            self.partial_frames += 1
+        self._scanned = len(buffer)
+        return frames
+
+    def reset(self):
+        """Drop any buffered partial frame."""
+        self._buffer.clear()
+        self._scanned = 0
+        self._discarding = False
+
 
 class AsyncSocketConnection:
-    def __init__(self, host, port, response_cb, reconnect_delay=10):
+    def __init__(self, host, port, response_cb, reconnect_delay=10, max_frame=MAX_FRAME,
+                 write_interval=WRITE_INTERVAL, max_write=MAX_WRITE, max_in_flight=MAX_IN_FLIGHT,
+                 ack_timeout=ACK_TIMEOUT, high_water=HIGH_WATER, low_water=LOW_WATER,
+                 reconnect_min_delay=RECONNECT_MIN_DELAY, outage_buffer=OUTAGE_BUFFER, state_cb=None,
+                 metrics=None, trace=None, connect_timeout=CONNECT_TIMEOUT):
         self.host = host
         self.port = port
         self.reader = None
         self.writer = None
         self.callback = response_cb
-        self.reconnect_delay = reconnect_delay
+        self.state_cb = state_cb    # Called with True/False when the link goes up/down
+        self.reconnect_delay = reconnect_delay  # Upper bound of the reconnect backoff
+        self.reconnect_min_delay = reconnect_min_delay
+        self.outage_buffer = outage_buffer
+        self.connect_timeout = connect_timeout
+        self.connected = asyncio.Event()
+        self.framer = LineFramer(max_frame)
+        self.write_interval = write_interval
+        self.max_write = max_write
+        self.max_in_flight = max_in_flight  # None disables the window
+        self.ack_timeout = ack_timeout
+        self.high_water = high_water
+        self.low_water = low_water
+        self.in_flight = 0
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.trace = trace          # Optional wire tap, see pyp8.trace.TraceRecorder
+        self._outbox = collections.OrderedDict()   # [key] -> command, in send order
+        self._outbox_ready = asyncio.Event()
+        self._window_open = asyncio.Event()
+        self._window_open.set()
+        self._writable = asyncio.Event()
+        self._writable.set()
+        self._write_task = None
+        self._supervisor = None
+        self._expire_handle = None
+        self._discarding = False    # Outage outlasted outage_buffer, drop new commands
+        self._sequence = itertools.count()  # Keys for commands that are never coalesced
         LOG.debug('Starting AsyncSocketConnection')
 
+    def start(self):
+        """Start the connection supervisor and writer without waiting for the link."""
+        if self._supervisor is None or self._supervisor.done():
+            self._supervisor = asyncio.create_task(self.supervise())
+        if not self.connected.is_set() and self._expire_handle is None and not self._discarding:
+            # Commands queued before the link first comes up age out like during an outage
+            self._arm_expiry()
+        if self._write_task is None or self._write_task.done():
+            self._write_task = asyncio.create_task(self.write_loop())
+
     async def connect(self):
-        try:
-            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
-            LOG.debug(f"Connected to {self.host}:{self.port}")
-            asyncio.create_task(self.read_loop())
-        except Exception as e:
-            LOG.error(f"Connection failed: {e}")
-            await self.reconnect()
+        """Start the connection and wait until the link is up."""
+        self.start()
+        await self.connected.wait()
+
+    async def supervise(self):
+        """Keep the link up, reconnecting with jittered exponential backoff."""
+        delay = self.reconnect_min_delay
+        was_connected = False
+        while True:
+            try:
+                self.reader, self.writer = await asyncio.wait_for(
+                    asyncio.open_connection(self.host, self.port), self.connect_timeout
+                )
+            except asyncio.TimeoutError:
+                LOG.error('Connection to %s:%s timed out after %ss', self.host, self.port, self.connect_timeout)
+            except OSError as e:
+                LOG.error('Connection failed: %s', e)
+            else:
+                LOG.debug('Connected to %s:%s', self.host, self.port)
+                if was_connected:
+                    self.metrics.reconnects += 1
+                was_connected = True
+                delay = self.reconnect_min_delay
+                self.framer.reset()
+                self.in_flight = 0
+                self._window_open.set()
+                self._set_connected(True)
+                try:
+                    await self.read_loop()
+                finally:
+                    self._set_connected(False)
+                    self.writer.close()
+
+            wait = delay * random.uniform(0.5, 1.5)
+            LOG.debug('Attempting to reconnect in %.3f seconds...', wait)
+            await asyncio.sleep(wait)
+            delay = min(delay * 2, self.reconnect_delay)
+
+    def _set_connected(self, connected):
+        if connected:
+            if self._expire_handle:
+                self._expire_handle.cancel()
+                self._expire_handle = None
+            self._discarding = False
+            self.connected.set()
+        else:
+            self.connected.clear()
+            self._arm_expiry()
+        if self.state_cb:
+            self.state_cb(connected)
+
+    def _arm_expiry(self):
+        self._expire_handle = asyncio.get_running_loop().call_later(
+            self.outage_buffer, self._expire_outbox
+        )
+
+    def _expire_outbox(self):
+        """Drop commands queued during an outage that has lasted too long."""
+        LOG.warning(f"Disconnected for {self.outage_buffer}s, dropping {len(self._outbox)} queued commands")
+        self._expire_handle = None
+        self._discarding = True
+        self._outbox.clear()
+        self._writable.set()
 
     async def read_loop(self):
+        """Read until the connection closes or fails."""
+        metrics = self.metrics
         while True:
             try:
                 data = await self.reader.read(1024)
-                if data:
-                    for d in data.decode().split('\r\n'):
-                        if d != '':
-                            LOG.debug(f"Received: {d}")
-                            await self.callback(d)
-                else:
-                    LOG.debug("Connection closed by server.")
-                    await self.reconnect()
-                    break
-            except Exception as e:
-                LOG.error(f"Read loop error: {e}")
-                await self.reconnect()
-                break
+            except OSError as e:
+                LOG.error('Read loop error: %s', e)
+                return
+            if not data:
+                LOG.debug("Connection closed by server.")
+                return
+
+            frames = self.framer.feed(data)
+            metrics.bytes_in += len(data)
+            metrics.lines_in += len(frames)
+            self._acknowledge(len(frames))
+            for frame in frames:
+                d = frame.decode(errors='replace')
+                LOG.debug('Received: %s', d)
+                if self.trace:
+                    self.trace.record('in', d)
+                try:
+                    await self.callback(d)
+                except Exception:
+                    LOG.exception('Error handling %s', d)
+
+    @property
+    def queue_depth(self):
+        """Number of commands waiting to be written."""
+        return len(self._outbox)
+
+    @property
+    def backpressure(self):
+        """True while the queue is above the high water mark."""
+        return not self._writable.is_set()
+
+    async def wait_writable(self):
+        """Wait until the queue has drained below the low water mark."""
+        await self._writable.wait()
+
+    async def send_command(self, command, key=None):
+        """Queue a command for the writer task.
+
+        A queued command with the same key is superseded: it is dropped and
+        the new command goes to the back of the queue, so only the latest
+        value for e.g. a zone's volume reaches the matrix. Returns the
+        superseded command, or None.
+        """
+        if self._discarding:
+            LOG.debug('Not connected, dropping: %s', command)
+            return None
+        outbox = self._outbox
+        superseded = None
+        if key is None:
+            key = next(self._sequence)
+        elif key in outbox:
+            outbox.move_to_end(key)
+            superseded = outbox[key]
+        outbox[key] = command
+        if len(outbox) > self.metrics.max_queue_depth:
+            self.metrics.max_queue_depth = len(outbox)
+        if len(outbox) >= self.high_water:
+            self._writable.clear()
+        self._outbox_ready.set()
+        return superseded
+
+    async def send_commands(self, commands, keys=None):
+        """Queue several commands, optionally with a coalescing key each.
+
+        Returns the superseded command, or None, for each command.
+        """
+        if keys is None:
+            keys = itertools.repeat(None)
+        return [await self.send_command(command, key) for command, key in zip(commands, keys)]
 
-    async def send_command(self, command):
-        LOG.debug(f'Sending: {command}')
-        self.writer.write(command.encode())
-        await self.writer.drain()
+    def _acknowledge(self, replies):
+        """Count received replies against the commands in flight."""
+        if self.in_flight:
+            self.in_flight = max(self.in_flight - replies, 0)
+        if self.max_in_flight is None or self.in_flight < self.max_in_flight:
+            self._window_open.set()
+
+    async def _wait_for_window(self):
+        """Wait for room in the in-flight window, returning the number of free slots."""
+        if self.max_in_flight is None:
+            return None
+        if self.in_flight >= self.max_in_flight:
+            self._window_open.clear()
+            try:
+                await asyncio.wait_for(self._window_open.wait(), self.ack_timeout)
+            except asyncio.TimeoutError:
+                LOG.debug('No reply to %d commands, reopening window', self.in_flight)
+                self.in_flight = 0
+        return self.max_in_flight - self.in_flight
+
+    async def write_loop(self):
+        """Merge queued commands into paced, pipelined socket writes."""
+        outbox = self._outbox
+        metrics = self.metrics
+        while True:
+            await self._outbox_ready.wait()
+            await self.connected.wait()
+            self._outbox_ready.clear()
+            slots = await self._wait_for_window()
+
+            batch = []
+            size = 0
+            while outbox and size < self.max_write and slots != 0:
+                _, command = outbox.popitem(last=False)
+                batch.append(command)
+                size += len(command)
+                if slots is not None:
+                    slots -= 1
+            if outbox:
+                self._outbox_ready.set()
+            if len(outbox) <= self.low_water:
+                self._writable.set()
+            if not batch:
+                continue
+
+            data = ''.join(batch)
+            LOG.debug('Sending: %s', data)
+            if self.trace:
+                self.trace.record('out', data)
+            data = data.encode()
+            self.in_flight += len(batch)
+            try:
+                self.writer.write(data)
+                start = time.monotonic()
+                await self.writer.drain()
+                metrics.drain.observe(time.monotonic() - start)
+            except Exception as e:
+                LOG.error('Write error: %s', e)
+            else:
+                metrics.writes += 1
+                metrics.lines_out += len(batch)
+                metrics.bytes_out += len(data)
+            await asyncio.sleep(self.write_interval)
 
     async def close(self):
+        for task in (self._supervisor, self._write_task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        if self._expire_handle:
+            self._expire_handle.cancel()
+            self._expire_handle = None
         if self.writer:
             self.writer.close()
-            await self.writer.wait_closed()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
             LOG.debug("Connection closed.")
-
-    async def reconnect(self):
-        LOG.debug(f"Attempting to reconnect in {self.reconnect_delay} seconds...")
-        await asyncio.sleep(self.reconnect_delay)
-        await self.connect()
@@ -0,0 +1,559 @@
+"""Controller for a Pulse-Eight ProAudio matrix."""
+import asyncio
+import collections
+import logging
+import time
+import weakref
+
+from .connection import AsyncSocketConnection
+from .events import DROP_OLDEST, EVENT_QUEUE_SIZE, EventSubscription
+from .metrics import Metrics
+from .protocol import (
+    LABEL_FIELDS, MAX_SOURCES, MAX_ZONES, PARSER, SCENE_FIELDS, STATUS_FIELDS, TONE_FIELDS,
+    VALUE_RANGES, encode_command, encode_group_command, encode_query,
+)
+from .poller import StatusPoller
+from .ramp import VolumeRamper
+from .routing import RoutingIndex
+from .state import ZoneStateTable
+
+LOG = logging.getLogger(__name__)
+
+COMMAND_TIMEOUT = 2         # Seconds to wait for a confirmed command
+LATENCY_SAMPLES = 100       # Confirmed command round trip times kept
+MAX_GROUP_ZONES = 16        # Zones addressed by a single multi-zone command
+
+
+class AmpControlAsync:
+    """Controller for one matrix, sharing a single connection between all its zones."""
+
+    def __init__(self, host, port, status_cb=None, multi_zone=True, **connection_options):
+        LOG.debug('Starting amp')
+        self.host = host
+        self.port = port
+        self.subscribers = [status_cb] if status_cb else []
+        self.connection_subscribers = []
+        self._event_subscriptions = weakref.WeakSet()   # Dropped when their consumer lets go
+        self.parser = PARSER
+        self.multi_zone = multi_zone    # Matrix accepts '@a,@b' zone lists
+        self._waiters = {}  # [(command, zone)] -> {future: expected value or None}
+        self.command_latency = collections.deque(maxlen=LATENCY_SAMPLES)
+        self.zones = set()  # Zones queried or reported, resynced after a reconnect
+        self.state = ZoneStateTable(SCENE_FIELDS)
+        self.routing = RoutingIndex()
+        self.labels = {field: {} for field in LABEL_FIELDS}  # [field] -> {number: label}
+        self._resync_task = None
+        self.ramper = VolumeRamper(self)
+        self.poller = None
+        self.metrics = Metrics()
+        self.connection = AsyncSocketConnection(
+            self.host, self.port, self.response_cb, state_cb=self.connection_state_cb,
+            metrics=self.metrics, **connection_options
+        )
+
+    def start(self):
+        """Start connecting in the background, commands are queued until the link is up."""
+        LOG.debug('Starting connection')
+        self.connection.start()
+
+    async def connect(self):
+        LOG.debug('Starting connection')
+        await self.connection.connect()
+
+    async def close(self):
+        self.stop_polling()
+        self.ramper.stop()
+        if self._resync_task:
+            self._resync_task.cancel()
+            self._resync_task = None
+        for subscription in list(self._event_subscriptions):
+            subscription.close()
+        await self.connection.close()
+
+    def start_polling(self, **options):
+        """Start background polling of known zones, see StatusPoller for options."""
+        if self.poller is None:
+            self.poller = StatusPoller(self, **options)
+        self.poller.start()
+
+    def stop_polling(self):
+        if self.poller is not None:
+            self.poller.stop()
+
+    @property
+    def connected(self):
+        return self.connection.connected.is_set()
+
+    def connection_state_cb(self, connected):
+        for callback in self.connection_subscribers:
+            try:
+                callback(connected)
+            except Exception:
+                LOG.exception('Error in connection state callback')
+        if connected and self.zones:
+            LOG.info(f'Connected, resyncing status of {len(self.zones)} zones')
+            self._resync_task = asyncio.create_task(self.get_status_many(sorted(self.zones)))
+
+    @property
+    def backpressure(self):
+        """True while the outbound queue is too deep for more commands."""
+        return self.connection.backpressure
+
+    def diagnostics(self):
+        """Return the metrics and current link state as a plain dict."""
+        data = self.metrics.as_dict()
+        data.update(
+            connected=self.connected,
+            queue_depth=self.connection.queue_depth,
+            in_flight=self.connection.in_flight,
+            zones=len(self.zones),
+            polls=self.poller.polls if self.poller is not None else 0,
+        )
+        return data
+
+    async def response_cb(self, message):
+        #LOG.debug(f'CB: {message.strip()}')
+        status = self.parser.parse(message)
+        if status is None:
+            self.metrics.parse_miss(message)
+            return
+        self.metrics.parse_hits[status.command] += 1
+
+        key = (status.command, status.zone)
+        waiters = self._waiters.get(key)
+        if waiters:
+            value = status.value
+            for future, expected in list(waiters.items()):
+                if expected is None or expected == value:
+                    del waiters[future]
+                    if not future.done():
+                        future.set_result(value)
+            if not waiters:
+                del self._waiters[key]
+
+        labels = self.labels.get(status.field)
+        if labels is not None:
+            labels[status.zone] = status.value
+            return
+
+        self.zones.add(status.zone)
+        delta = self.state.update(status.zone, status.field, status.value)
+        if self.poller is not None:
+            self.poller.heard(status.zone, delta is not None)
+        if delta is None:
+            return
+        if delta.field == 'source':
+            self.routing.update(delta.zone, delta.new)
+        for subscription in self._event_subscriptions:
+            subscription.put(delta)
+        for subscriber in self.subscribers:
+            await subscriber(delta)
+
+    def events(self, zones=None, fields=None, maxsize=EVENT_QUEUE_SIZE, overflow=DROP_OLDEST):
+        """Return a subscription to status changes, iterated with ``async for``.
+
+        Each subscription has its own bounded queue, see EventSubscription
+        for the overflow policies, and only receives changes to the given
+        zones and fields. It ends when closed, when used as an async context
+        manager, or when the controller closes, and is dropped once nothing
+        refers to it.
+        """
+        subscription = EventSubscription(zones, fields, maxsize, overflow)
+        self._event_subscriptions.add(subscription)
+        return subscription
+
+    def subscribe(self, status_cb):
+        """Add a coroutine called with a StatusDelta for every status change.
+
+        It is awaited before the next reply is read, prefer events() for
+        anything slower than updating memory.
+        """
+        self.subscribers.append(status_cb)
+
+    def unsubscribe(self, status_cb):
+        if status_cb in self.subscribers:
+            self.subscribers.remove(status_cb)
+
+    def subscribe_connection(self, callback):
+        """Add a function called with True/False when the link goes up/down."""
+        self.connection_subscribers.append(callback)
+
+    def unsubscribe_connection(self, callback):
+        if callback in self.connection_subscribers:
+            self.connection_subscribers.remove(callback)
+
+    def _expect(self, command, zone, expected=None):
+        """Return a future resolved by the next reply for the zone.
+
+        If an expected value is given, replies reporting other values (e.g.
+        to earlier commands still in flight) are skipped.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault((command, zone), {})[future] = expected
+        return future
+
+    def _forget(self, command, zone, future):
+        waiters = self._waiters.get((command, zone))
+        if waiters is not None:
+            waiters.pop(future, None)
+            if not waiters:
+                del self._waiters[(command, zone)]
+
+    def _supersede(self, command, zones, superseded, value):
+        """Move waiters for a queued command that was dropped unsent to the value replacing it.
+
+        Otherwise a confirmed command superseded by a later one, e.g. while a
+        volume slider is dragged, would wait for a reply that never comes.
+        """
+        if superseded is None:
+            return
+        for zone in zones:
+            waiters = self._waiters.get((command, zone), {})
+            for future, expected in waiters.items():
+                if expected is not None and encode_group_command(command, zones, expected) == superseded:
+                    waiters[future] = value
+
+    async def _send_queries(self, queries):
+        """Queue (command, zone) status queries, merging repeats still waiting to be sent."""
+        await self.connection.send_commands(
+            [encode_query(command, zone) for command, zone in queries],
+            keys=[(command, zone, '?') for command, zone in queries],
+        )
+
+    async def get_status(self, zone):
+        LOG.info(f'Getting status for zone {zone}')
+        await self._send_queries([(self.parser.commands[field], zone) for field in STATUS_FIELDS])
+
+    async def get_status_many(self, zones, fields=STATUS_FIELDS, timeout=5):
+        """Query several zones with one write.
+
+        Returns once every reply has arrived or the timeout expires, with
+        the values received as {zone: {field: value}}.
+        """
+        queries = []
+        expected = {}
+        zones = list(zones)
+        self.zones.update(zones)
+        for zone in zones:
+            for field in fields:
+                command = self.parser.commands[field]
+                queries.append((command, zone))
+                expected[(command, zone, field)] = self._expect(command, zone)
+        if not queries:
+            return {}
+
+        LOG.info(f'Getting status for {len(queries)} fields')
+        await self._send_queries(queries)
+        _, pending = await asyncio.wait(expected.values(), timeout=timeout)
+        if pending:
+            LOG.warning(f'Timed out waiting for {len(pending)} of {len(queries)} status replies')
+
+        status = {}
+        for (command, zone, field), future in expected.items():
+            if future.done():
+                status.setdefault(zone, {})[field] = future.result()
+            else:
+                future.cancel()
+                self._forget(command, zone, future)
+        return status
+
+
+
+    async def send(self, command, zone, value, confirm=False, timeout=COMMAND_TIMEOUT):
+        """Send a command, optionally waiting for the matrix to confirm it.
+
+        With confirm the value reported in the matching reply is returned,
+        and asyncio.TimeoutError is raised if none arrives in time.
+        """
+        data = encode_command(command, zone, value)
+        await self.connection.wait_writable()
+        # Absolute values supersede each other, relative steps must all be sent
+        relative = isinstance(value, str) and value[:1] in '+-'
+        key = None if relative else (command, zone)
+        if not confirm:
+            superseded = await self.connection.send_command(data, key)
+            self._supersede(command, [zone], superseded, value)
+            return None
+
+        future = self._expect(command, zone, None if relative else value)
+        start = time.monotonic()
+        superseded = await self.connection.send_command(data, key)
+        self._supersede(command, [zone], superseded, value)
+        try:
+            result = await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            self._forget(command, zone, future)
+            LOG.warning(f'No confirmation of {data} within {timeout}s')
+            raise
+        latency = time.monotonic() - start
+        self.command_latency.append(latency)
+        self.metrics.rtt.observe(latency)
+        return result
+
+    async def set_power(self, zone: int, power: bool, **kwargs):
+        if power:
+            LOG.info(f'Powering on zone {zone}')
+        else:
+            LOG.info(f'Powering off zone {zone}')
+        return await self.send('PZ', zone, int(power), **kwargs)
+
+    async def set_mute(self, zone: int, mute: bool, **kwargs):
+        if mute:
+            LOG.info(f'Muting zone {zone}')
+        else:
+            LOG.info(f'Unmuting zone {zone}')
+        return await self.send('MZ', zone, int(mute), **kwargs)
+
+    async def set_volume(self, zone: int, volume: int, **kwargs):
+        LOG.info(f'Setting volume to {volume} on zone {zone}')
+        self.ramper.cancel([zone])
+        return await self.send('VPZ', zone, volume, **kwargs)
+
+    async def volume_up(self, zone: int, steps: int = 2, **kwargs):
+        LOG.info(f'Volume up on zone {zone}')
+        self.ramper.cancel([zone])
+        return await self.send('VPZ', zone, f'+{steps}', **kwargs)
+
+    async def volume_down(self, zone: int, steps: int = 2, **kwargs):
+        LOG.info(f'Volume down on zone {zone}')
+        self.ramper.cancel([zone])
+        return await self.send('VPZ', zone, f'-{steps}', **kwargs)
+
+    async def set_source(self, zone: int, source: int, **kwargs):
+        LOG.info(f'Setting source to {source} on zone {zone}')
+        return await self.send('SZ', zone, source, **kwargs)
+
+    async def set_bass(self, zone: int, level: int, **kwargs):
+        LOG.info(f'Setting bass to {level} on zone {zone}')
+        return await self._set_level('bass', zone, level, **kwargs)
+
+    async def set_treble(self, zone: int, level: int, **kwargs):
+        LOG.info(f'Setting treble to {level} on zone {zone}')
+        return await self._set_level('treble', zone, level, **kwargs)
+
+    async def set_balance(self, zone: int, level: int, **kwargs):
+        """Set balance from -10 (left) to +10 (right)."""
+        LOG.info(f'Setting balance to {level} on zone {zone}')
+        return await self._set_level('balance', zone, level, **kwargs)
+
+    async def _set_level(self, field, zone, level, **kwargs):
+        values = self._validate(field, {zone: level})
+        return await self.send(self.parser.commands[field], zone, values[zone], **kwargs)
+
+    async def get_firmware(self, timeout=COMMAND_TIMEOUT):
+        """Return the firmware version reported by the matrix, None if it does not answer."""
+        future = self._expect('FW', 0)
+        await self.connection.send_command(encode_query('FW', 0), ('FW', 0, '?'))
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            self._forget('FW', 0, future)
+            return None
+
+    async def discover_labels(self, zones=range(1, MAX_ZONES + 1), sources=range(1, MAX_SOURCES + 1),
+                              timeout=5, settle=0.5):
+        """Query the firmware version and every zone and source name in one write.
+
+        Matrices only name the zones and sources they have, so once replies
+        start arriving this stops waiting when they pause for settle
+        seconds. Returns {'firmware': version, 'zones': {zone: name},
+        'sources': {source: name}}.
+        """
+        commands = [encode_query('FW', 0)]
+        expected = [('FW', 0, self._expect('FW', 0))]
+        size = MAX_GROUP_ZONES if self.multi_zone else 1
+        for command, numbers in (('NZ', list(zones)), ('NS', list(sources))):
+            for i in range(0, len(numbers), size):
+                commands.append(encode_group_command(command, numbers[i:i + size], '?'))
+            expected.extend((command, number, self._expect(command, number)) for number in numbers)
+
+        LOG.info(f'Discovering labels of {len(expected) - 1} zones and sources')
+        await self.connection.send_commands(commands)
+        pending = {future for _, _, future in expected}
+        wait = timeout
+        while pending:
+            done, pending = await asyncio.wait(pending, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                break
+            wait = settle
+        for command, number, future in expected:
+            if not future.done():
+                future.cancel()
+                self._forget(command, number, future)
+
+        return {
+            'firmware': self.labels['firmware'].get(0),
+            'zones': dict(self.labels['zone_name']),
+            'sources': dict(self.labels['source_name']),
+        }
+
+    def _validate(self, field, values):
+        """Check a {zone: value} batch, returning it with values as protocol integers."""
+        minimum, maximum = VALUE_RANGES[field]
+        checked = {}
+        for zone, value in values.items():
+            if not isinstance(zone, int) or not 1 <= zone <= MAX_ZONES:
+                raise ValueError(f'Invalid zone {zone!r}')
+            value = int(value)
+            if not minimum <= value <= maximum:
+                raise ValueError(f'Invalid {field} {value} for zone {zone}')
+            checked[zone] = value
+        return checked
+
+    async def send_many(self, command, values, confirm=False, timeout=COMMAND_TIMEOUT):
+        """Send a command to several zones, {zone: value}, as one batch.
+
+        Zones sharing a value are addressed by one multi-zone command where
+        the matrix supports it, otherwise each zone gets its own command in
+        the same write. With confirm, returns the confirmed {zone: value}.
+        """
+        if not values:
+            return {} if confirm else None
+        groups = {}
+        for zone, value in values.items():
+            groups.setdefault(value, []).append(zone)
+
+        commands = []
+        keys = []
+        chunks = []
+        expected = {}
+        for value, zones in groups.items():
+            relative = isinstance(value, str) and value[:1] in '+-'
+            size = MAX_GROUP_ZONES if self.multi_zone else 1
+            for i in range(0, len(zones), size):
+                chunk = zones[i:i + size]
+                chunks.append((chunk, value))
+                commands.append(encode_group_command(command, chunk, value))
+                if relative:
+                    keys.append(None)
+                else:
+                    keys.append((command, chunk[0]) if len(chunk) == 1 else (command, tuple(chunk)))
+            if confirm:
+                for zone in zones:
+                    expected[zone] = self._expect(command, zone, None if relative else value)
+        self.zones.update(values)
+
+        await self.connection.wait_writable()
+        start = time.monotonic()
+        superseded = await self.connection.send_commands(commands, keys)
+        for (chunk, value), dropped in zip(chunks, superseded):
+            self._supersede(command, chunk, dropped, value)
+        if not confirm:
+            return None
+
+        _, pending = await asyncio.wait(expected.values(), timeout=timeout)
+        for zone, future in expected.items():
+            if not future.done():
+                future.cancel()
+                self._forget(command, zone, future)
+        if pending:
+            LOG.warning(f'No confirmation from {len(pending)} of {len(expected)} zones within {timeout}s')
+            raise asyncio.TimeoutError()
+        latency = time.monotonic() - start
+        self.command_latency.append(latency)
+        self.metrics.rtt.observe(latency)
+        return {zone: future.result() for zone, future in expected.items()}
+
+    async def set_power_many(self, zones, power: bool, **kwargs):
+        values = self._validate('power', dict.fromkeys(zones, power))
+        LOG.info(f'Powering {"on" if power else "off"} zones {list(values)}')
+        return await self.send_many('PZ', values, **kwargs)
+
+    async def set_mute_many(self, zones, mute: bool, **kwargs):
+        values = self._validate('mute', dict.fromkeys(zones, mute))
+        LOG.info(f'{"Muting" if mute else "Unmuting"} zones {list(values)}')
+        return await self.send_many('MZ', values, **kwargs)
+
+    async def set_volume_many(self, volumes, **kwargs):
+        """Set volumes given as {zone: volume}."""
+        values = self._validate('volume', volumes)
+        LOG.info(f'Setting volumes {values}')
+        self.ramper.cancel(values)
+        return await self.send_many('VPZ', values, **kwargs)
+
+    async def volume_up_many(self, zones, steps: int = 2, **kwargs):
+        values = self._validate('volume', dict.fromkeys(zones, 0))
+        LOG.info(f'Volume up on zones {list(values)}')
+        self.ramper.cancel(values)
+        return await self.send_many('VPZ', dict.fromkeys(values, f'+{steps}'), **kwargs)
+
+    async def volume_down_many(self, zones, steps: int = 2, **kwargs):
+        values = self._validate('volume', dict.fromkeys(zones, 0))
+        LOG.info(f'Volume down on zones {list(values)}')
+        self.ramper.cancel(values)
+        return await self.send_many('VPZ', dict.fromkeys(values, f'-{steps}'), **kwargs)
+
+    async def set_source_many(self, sources, **kwargs):
+        """Set sources given as {zone: source}."""
+        values = self._validate('source', sources)
+        LOG.info(f'Setting sources {values}')
+        return await self.send_many('SZ', values, **kwargs)
+
+    async def ramp_volume(self, zones, volume: int, duration: float):
+        """Fade zones to a volume over duration seconds.
+
+        Returns True once every zone got there, False if a later volume
+        command cancelled or retargeted any of the ramps.
+        """
+        values = self._validate('volume', dict.fromkeys(zones, volume))
+        LOG.info(f'Ramping zones {list(values)} to volume {volume} over {duration}s')
+        self.zones.update(values)
+        unknown = [zone for zone in values if self.state.get(zone, 'volume') is None]
+        if unknown:
+            # Fade from the current volume of zones not synced yet instead of jumping
+            await self.get_status_many(unknown, fields=('volume',))
+        return all(await self.ramper.ramp(values, volume, duration))
+
+    def snapshot(self, zones=None):
+        """Return the cached {zone: {field: value}} status, no queries are sent."""
+        return {
+            zone: {field: status[field] for field in SCENE_FIELDS if field in status}
+            for zone, status in self.state.snapshot(zones).items()
+        }
+
+    async def restore(self, snapshot, **kwargs):
+        """Return zones to a snapshot, sending only the fields that differ.
+
+        Everything is queued together so the writer sends it as one burst.
+        Zones are powered on first and off last, so settings are applied
+        while the zone is on.
+        """
+        power_on, power_off, mute_on, mute_off = [], [], [], []
+        volumes = {}
+        sources = {}
+        levels = {field: {} for field in TONE_FIELDS}
+        for zone, status in snapshot.items():
+            current = self.state.zone(zone)
+            changed = {
+                field: value for field, value in status.items() if current.get(field) != value
+            }
+            if 'power' in changed:
+                (power_on if changed['power'] else power_off).append(zone)
+            if 'mute' in changed:
+                (mute_on if changed['mute'] else mute_off).append(zone)
+            if 'volume' in changed:
+                volumes[zone] = changed['volume']
+            if 'source' in changed:
+                sources[zone] = changed['source']
+            for field in TONE_FIELDS:
+                if field in changed:
+                    levels[field][zone] = changed[field]
+
+        LOG.info(f'Restoring {len(snapshot)} zones')
+        calls = []
+        if power_on:
+            calls.append(self.set_power_many(power_on, True, **kwargs))
+        if sources:
+            calls.append(self.set_source_many(sources, **kwargs))
+        if volumes:
+            calls.append(self.set_volume_many(volumes, **kwargs))
+        for field, values in levels.items():
+            if values:
+                calls.append(self.send_many(self.parser.commands[field], self._validate(field, values), **kwargs))
+        if mute_on:
+            calls.append(self.set_mute_many(mute_on, True, **kwargs))
+        if mute_off:
+            calls.append(self.set_mute_many(mute_off, False, **kwargs))
+        if power_off:
+            calls.append(self.set_power_many(power_off, False, **kwargs))
+        await asyncio.gather(*calls)
@@ -0,0 +1,96 @@
+"""Per consumer queues of status changes, read with ``async for``."""
+import asyncio
+import collections
+
+from .state import StatusDelta
+
+EVENT_QUEUE_SIZE = 256      # Changes held for a consumer before the overflow policy applies
+
+DROP_OLDEST = 'drop_oldest'     # Discard the oldest queued change
+COALESCE = 'coalesce'           # Merge queued changes to the same zone field
+OVERFLOW_POLICIES = (DROP_OLDEST, COALESCE)
+
+
+class EventSubscription:
+    """Bounded queue of StatusDelta events for one consumer.
+
+    The controller puts changes without ever waiting, so a slow consumer
+    only delays itself. With DROP_OLDEST a full queue discards its oldest
+    change. With COALESCE a change to a zone field already queued is merged
+    into that entry, keeping its original old value and position, so the
+    consumer sees the latest value of every field; merges that end where
+    they started are dropped. Either way dropped counts what was lost.
+    """
+
+    def __init__(self, zones=None, fields=None, maxsize=EVENT_QUEUE_SIZE, overflow=DROP_OLDEST):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f'Unknown overflow policy {overflow!r}')
+        self.zones = frozenset(zones) if zones is not None else None
+        self.fields = frozenset(fields) if fields is not None else None
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.dropped = 0
+        self.closed = False
+        if overflow == COALESCE:
+            self._queue = collections.OrderedDict()     # [(zone, field)] -> StatusDelta
+        else:
+            self._queue = collections.deque()
+        self._ready = asyncio.Event()
+
+    def __len__(self):
+        return len(self._queue)
+
+    def put(self, delta):
+        """Queue a change if it passes the filters, never waits."""
+        if self.closed:
+            return
+        if self.zones is not None and delta.zone not in self.zones:
+            return
+        if self.fields is not None and delta.field not in self.fields:
+            return
+
+        queue = self._queue
+        if self.overflow == COALESCE:
+            key = (delta.zone, delta.field)
+            queued = queue.get(key)
+            if queued is not None:
+                if queued.old == delta.new:
+                    del queue[key]
+                else:
+                    queue[key] = StatusDelta(delta.zone, delta.field, queued.old, delta.new)
+                return
+            if len(queue) >= self.maxsize:
+                queue.popitem(last=False)
+                self.dropped += 1
+            queue[key] = delta
+        else:
+            if len(queue) >= self.maxsize:
+                queue.popleft()
+                self.dropped += 1
+            queue.append(delta)
+        self._ready.set()
+
+    def close(self):
+        """End iteration once the queued changes have been read."""
+        self.closed = True
+        self._ready.set()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        queue = self._queue
+        while not queue:
+            if self.closed:
+                raise StopAsyncIteration
+            self._ready.clear()
+            await self._ready.wait()
+        if self.overflow == COALESCE:
+            return queue.popitem(last=False)[1]
+        return queue.popleft()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
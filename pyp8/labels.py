@@ -0,0 +1,60 @@
+"""Zone and source names discovered from the matrix, cached on disk per firmware."""
+import asyncio
+import json
+import logging
+import os
+
+LOG = logging.getLogger(__name__)
+
+
+def load_cache(path):
+    """Return the labels saved at path, None if there are none."""
+    try:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        LOG.warning(f'Ignoring unreadable label cache {path}: {e}')
+        return None
+    # JSON object keys are strings
+    return {
+        'firmware': data.get('firmware'),
+        'zones': {int(zone): name for zone, name in data.get('zones', {}).items()},
+        'sources': {int(source): name for source, name in data.get('sources', {}).items()},
+    }
+
+
+def save_cache(path, labels):
+    """Write labels to path, replacing any previous cache in one step."""
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w', encoding='utf-8') as f:
+        json.dump(labels, f, indent=2, sort_keys=True)
+    os.replace(temporary, path)
+
+
+async def async_get_labels(amp, path=None, **options):
+    """Return {'firmware', 'zones', 'sources'} labels for a connected controller.
+
+    With a cache path the saved labels are used as long as the matrix
+    still reports the firmware they were discovered with, otherwise they
+    are rediscovered with one bulk query and saved. Options are passed to
+    amp.discover_labels.
+    """
+    loop = asyncio.get_running_loop()
+    if path is not None:
+        cached = await loop.run_in_executor(None, load_cache, path)
+        if cached is not None and await amp.get_firmware() == cached['firmware']:
+            LOG.debug('Using cached labels from %s', path)
+            amp.labels['firmware'][0] = cached['firmware']
+            amp.labels['zone_name'].update(cached['zones'])
+            amp.labels['source_name'].update(cached['sources'])
+            return cached
+
+    labels = await amp.discover_labels(**options)
+    if path is not None and (labels['zones'] or labels['sources']):
+        try:
+            await loop.run_in_executor(None, save_cache, path, labels)
+        except OSError as e:
+            LOG.warning(f'Could not save label cache {path}: {e}')
+    return labels
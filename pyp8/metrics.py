@@ -0,0 +1,87 @@
+"""Counters and latency histograms for the connection and controller hot paths."""
+import bisect
+import collections
+
+LATENCY_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0)  # Seconds
+MAX_MISS_TYPES = 32     # Distinct unparsed reply heads counted before lumping the rest together
+
+
+class Histogram:
+    """Fixed bucket histogram, cheap enough to update on every command."""
+
+    __slots__ = ('buckets', 'counts', 'count', 'total', 'max')
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)     # Last bucket counts values above buckets[-1]
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """Return the upper bound of the bucket holding the q quantile."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else None,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'max': self.max,
+        }
+
+
+class Metrics:
+    """Traffic, parse and latency statistics for one matrix connection."""
+
+    def __init__(self):
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.lines_in = 0
+        self.lines_out = 0
+        self.writes = 0
+        self.reconnects = 0         # Links re-established after going down
+        self.max_queue_depth = 0
+        self.parse_hits = collections.Counter()     # [command] -> replies parsed
+        self.parse_misses = collections.Counter()   # [reply head] -> replies not understood
+        self.drain = Histogram()    # Seconds each write waited on the transport
+        self.rtt = Histogram()      # Seconds from queueing a command to its confirmation
+
+    def parse_miss(self, line):
+        """Count a reply the parser did not understand, by the text before its first space."""
+        head = line.partition(' ')[0]
+        misses = self.parse_misses
+        if head not in misses and len(misses) >= MAX_MISS_TYPES:
+            head = 'other'
+        misses[head] += 1
+
+    def as_dict(self):
+        return {
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'lines_in': self.lines_in,
+            'lines_out': self.lines_out,
+            'writes': self.writes,
+            'reconnects': self.reconnects,
+            'max_queue_depth': self.max_queue_depth,
+            'parse_hits': dict(self.parse_hits),
+            'parse_misses': dict(self.parse_misses),
+            'drain': self.drain.as_dict(),
+            'rtt': self.rtt.as_dict(),
+        }
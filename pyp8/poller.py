@@ -0,0 +1,100 @@
+"""Background status polling to catch changes the matrix does not push."""
+import asyncio
+import logging
+import time
+
+from .protocol import STATUS_FIELDS
+
+LOG = logging.getLogger(__name__)
+
+ACTIVE_INTERVAL = 15    # Seconds between polls of zones that are on or recently changed
+IDLE_INTERVAL = 300     # Seconds between polls of other zones
+RECENT = 120            # Seconds a zone counts as active after a change
+POLL_BUDGET = 4         # Status queries per second the poller may send
+TICK = 1.0              # Seconds between scheduling passes
+
+
+class StatusPoller:
+    """Poll zones in proportion to how likely they are to have drifted.
+
+    Any reply for a zone, pushed or polled, restarts its interval, so zones
+    kept fresh by push updates are not polled. Due zones are polled most
+    overdue first, within a per second query budget, and each pass is
+    queued as one batch.
+    """
+
+    def __init__(self, amp, active_interval=ACTIVE_INTERVAL, idle_interval=IDLE_INTERVAL,
+                 recent=RECENT, budget=POLL_BUDGET, fields=STATUS_FIELDS):
+        self._amp = amp
+        self.active_interval = active_interval
+        self.idle_interval = idle_interval
+        self.recent = recent
+        self.budget = budget
+        self.fields = fields
+        self.polls = 0
+        self._last_heard = {}   # [zone] -> time of the last reply or poll
+        self._last_change = {}  # [zone] -> time of the last changed value
+        self._credit = 0.0
+        self._task = None
+
+    def heard(self, zone, changed):
+        """Record a reply for a zone."""
+        now = time.monotonic()
+        self._last_heard[zone] = now
+        if changed:
+            self._last_change[zone] = now
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def _interval(self, zone, now):
+        if self._amp.state.get(zone, 'power') is True:
+            return self.active_interval
+        if now - self._last_change.get(zone, float('-inf')) < self.recent:
+            return self.active_interval
+        return self.idle_interval
+
+    def due(self, now=None):
+        """Return the zones due a poll, most overdue first."""
+        if now is None:
+            now = time.monotonic()
+        overdue = []
+        for zone in self._amp.zones:
+            interval = self._interval(zone, now)
+            age = now - self._last_heard.get(zone, float('-inf'))
+            if age >= interval:
+                overdue.append((age / interval, zone))
+        overdue.sort(reverse=True)
+        return [zone for _, zone in overdue]
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(TICK)
+            if not self._amp.connected:
+                continue
+
+            # Unused budget carries over for at most one full round of queries
+            per_zone = len(self.fields)
+            self._credit = min(self._credit + self.budget * TICK, max(self.budget * TICK, per_zone))
+            count = int(self._credit // per_zone)
+            if not count:
+                continue
+            zones = self.due()[:count]
+            if not zones:
+                continue
+
+            now = time.monotonic()
+            for zone in zones:
+                self._last_heard[zone] = now
+            self._credit -= len(zones) * per_zone
+            self.polls += len(zones)
+            LOG.debug('Polling zones %s', zones)
+            await self._amp._send_queries([
+                (self._amp.parser.commands[field], zone) for zone in zones for field in self.fields
+            ])
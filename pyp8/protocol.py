@@ -0,0 +1,102 @@
+"""Pulse-Eight ProAudio response parsing.
+
+Replies from the matrix look like ``^=VPZ.2 @4,35$``. The command prefix is
+read once and used to look up a single decoder, rather than trying every
+known pattern in turn.
+"""
+from typing import Any, NamedTuple
+
+
+class ZoneStatus(NamedTuple):
+    command: str    # Protocol command, e.g. 'VPZ'
+    field: str      # Status field, e.g. 'volume'
+    zone: int
+    value: Any
+
+
+# Converters raise KeyError or ValueError on malformed values
+to_bool = {'0': False, '1': True}.__getitem__
+to_int = int
+
+
+def to_label(value):
+    """Zone and source names may be quoted, e.g. ``^=NZ.2 @4,"Garage"$``."""
+    return value.strip().strip('"')
+
+
+# Skips the generated NamedTuple.__new__ wrapper on the hot path
+_new_status = tuple.__new__
+
+
+class ResponseParser:
+    """Dispatch replies to a decoder registered for their command prefix."""
+
+    def __init__(self):
+        self.decoders = {}  # [command] -> (field, converter)
+        self.commands = {}  # [field]   -> command
+
+    def register(self, command, field, convert=to_int):
+        """Register a zone reply of the form ``^=<command>.2 @<zone>,<value>``."""
+        self.decoders[command] = (field, convert)
+        self.commands[field] = command
+
+    def parse(self, line):
+        """Return a ZoneStatus for a known reply, otherwise None."""
+        head, sep, tail = line.partition('.2 @')
+        if not sep or not head.startswith('^='):
+            return None
+        command = head[2:]
+        decoder = self.decoders.get(command)
+        if decoder is None:
+            return None
+
+        zone, sep, value = tail.partition(',')
+        field, convert = decoder
+        try:
+            return _new_status(ZoneStatus, (command, field, int(zone), convert(value.rstrip('$'))))
+        except (KeyError, ValueError):
+            return None
+
+
+def encode_command(command, zone, value):
+    return f'^{command} @{zone}, {value}$'
+
+
+def encode_group_command(command, zones, value):
+    """Address several zones at once, e.g. ``^PZ @4,@24, 1$``."""
+    return f'^{command} @{",@".join(map(str, zones))}, {value}$'
+
+
+def encode_query(command, zone):
+    return encode_command(command, zone, '?')
+
+
+PARSER = ResponseParser()
+PARSER.register('PZ', 'power', to_bool)     # Power status
+PARSER.register('VPZ', 'volume')            # Volume status (0-100%)
+PARSER.register('MZ', 'mute', to_bool)      # Mute status
+PARSER.register('SZ', 'source')             # Source status
+PARSER.register('BAZ', 'bass')              # Bass (-12 to +12)
+PARSER.register('TRZ', 'treble')            # Treble (-12 to +12)
+PARSER.register('BLZ', 'balance')           # Balance (-10 left to +10 right)
+# Label replies are numbered by zone or source, firmware is reported as zone 0
+PARSER.register('NZ', 'zone_name', to_label)
+PARSER.register('NS', 'source_name', to_label)
+PARSER.register('FW', 'firmware', to_label)
+
+STATUS_FIELDS = ('power', 'volume', 'mute', 'source')
+TONE_FIELDS = ('bass', 'treble', 'balance')
+SCENE_FIELDS = STATUS_FIELDS + TONE_FIELDS
+LABEL_FIELDS = ('zone_name', 'source_name', 'firmware')
+
+MAX_ZONES = 64
+MAX_SOURCES = 64
+VALUE_RANGES = {                            # [field] -> (minimum, maximum)
+    'power': (0, 1),
+    'volume': (0, 100),
+    'mute': (0, 1),
+    'source': (1, MAX_SOURCES),
+    'bass': (-12, 12),
+    'treble': (-12, 12),
+    'balance': (-10, 10),
+}
@@ -0,0 +1,122 @@
+"""Volume fades driven by a single timer task."""
+import asyncio
+import logging
+import time
+
+LOG = logging.getLogger(__name__)
+
+RAMP_RATE = 20          # Volume commands per second ramps may use on the link
+MAX_INTERVAL = 0.5      # Longest wait between ramp steps
+
+
+class _Ramp:
+    __slots__ = ('start', 'target', 'began', 'duration', 'last', 'done')
+
+    def __init__(self, start, target, duration, done):
+        # Without a known starting volume the target is sent on the first step
+        self.start = target if start is None else start
+        self.target = target
+        self.began = time.monotonic()
+        self.duration = duration
+        self.last = start
+        self.done = done    # Future resolved with True on completion, False if cancelled
+
+    def finish(self, completed):
+        # The caller may have stopped waiting, which cancels the future
+        if not self.done.done():
+            self.done.set_result(completed)
+
+
+class VolumeRamper:
+    """Fade zones to target volumes over a duration.
+
+    All active ramps are stepped by one task. Each step sets every zone to its
+    interpolated volume, so zones at the same volume share one multi-zone
+    command. The step interval grows with the number of commands a step needs
+    and backs off while the outbound queue is not keeping up, so fewer,
+    larger volume steps are used on a slow link.
+    """
+
+    def __init__(self, amp, rate=RAMP_RATE):
+        self._amp = amp
+        self.rate = rate
+        self._ramps = {}    # [zone] -> _Ramp
+        self._task = None
+        self._backoff = 1
+
+    @property
+    def active(self):
+        return set(self._ramps)
+
+    def ramp(self, zones, target, duration):
+        """Start or retarget ramps, returning a future resolved when all finish."""
+        loop = asyncio.get_running_loop()
+        futures = []
+        for zone in zones:
+            previous = self._ramps.pop(zone, None)
+            if previous is not None:
+                start = previous.last
+                previous.finish(False)
+            else:
+                start = self._amp.state.get(zone, 'volume')
+            ramp = _Ramp(start, target, duration, loop.create_future())
+            self._ramps[zone] = ramp
+            futures.append(ramp.done)
+
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return asyncio.gather(*futures)
+
+    def cancel(self, zones):
+        """Stop ramps on the zones, leaving them at their current volume."""
+        for zone in zones:
+            ramp = self._ramps.pop(zone, None)
+            if ramp is not None:
+                ramp.finish(False)
+
+    def stop(self):
+        """Cancel every ramp and the task stepping them."""
+        self.cancel(list(self._ramps))
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        connection = self._amp.connection
+        retry = {}
+        while self._ramps:
+            now = time.monotonic()
+            # Volumes from a failed step are resent unless the ramp was cancelled since
+            volumes = {zone: volume for zone, volume in retry.items() if zone in self._ramps}
+            finished = []
+            for zone, ramp in list(self._ramps.items()):
+                if ramp.duration > 0:
+                    progress = min((now - ramp.began) / ramp.duration, 1)
+                else:
+                    progress = 1
+                volume = round(ramp.start + (ramp.target - ramp.start) * progress)
+                if volume != ramp.last:
+                    volumes[zone] = volume
+                    ramp.last = volume
+                if progress >= 1:
+                    del self._ramps[zone]
+                    finished.append(ramp)
+
+            # Back off while the previous step is still queued behind other traffic
+            if connection.queue_depth:
+                self._backoff = min(self._backoff * 2, 8)
+            else:
+                self._backoff = 1
+            retry = {}
+            if volumes:
+                try:
+                    await self._amp.send_many('VPZ', volumes)
+                except Exception:
+                    LOG.exception(f'Ramp step for zones {list(volumes)} failed')
+                    retry = volumes
+            for ramp in finished:
+                ramp.finish(not retry)
+
+            commands = len(set(volumes.values())) or 1
+            interval = max(commands / self.rate, connection.write_interval) * self._backoff
+            await asyncio.sleep(min(interval, MAX_INTERVAL))
@@ -0,0 +1,56 @@
+"""Source routing of a matrix, the source of each zone and the zones on each source."""
+
+_NO_ZONES = frozenset()
+
+
+class RoutingIndex:
+    """Zone to source and source to zones maps, updated one zone at a time.
+
+    Every lookup is O(1). Zone sets are returned as live views of the index
+    and must not be modified.
+    """
+
+    def __init__(self):
+        self._source = {}   # [zone] -> source
+        self._zones = {}    # [source] -> set of zones
+
+    def __len__(self):
+        """Number of zones with a known source."""
+        return len(self._source)
+
+    def update(self, zone, source):
+        """Record the source a zone is switched to, None if unknown, returning the previous one."""
+        previous = self._source.get(zone)
+        if previous == source:
+            return previous
+        if previous is not None:
+            zones = self._zones[previous]
+            zones.discard(zone)
+            if not zones:
+                del self._zones[previous]
+        if source is None:
+            del self._source[zone]
+        else:
+            self._source[zone] = source
+            self._zones.setdefault(source, set()).add(zone)
+        return previous
+
+    def source(self, zone):
+        return self._source.get(zone)
+
+    def zones(self, source):
+        """Zones switched to a source."""
+        return self._zones.get(source, _NO_ZONES)
+
+    def sources(self):
+        """Sources with at least one zone switched to them."""
+        return self._zones.keys()
+
+    def shared_source(self, zones):
+        """Return the source all the given zones are switched to, None if they differ."""
+        zones = iter(zones)
+        source = self._source.get(next(zones, None))
+        if source is None:
+            return None
+        routed = self._zones[source]
+        return source if all(zone in routed for zone in zones) else None
@@ -0,0 +1,188 @@
+"""Local stand-in for a Pulse-Eight ProAudio matrix.
+
+Speaks the ``^VPZ @4, 35$`` command grammar over TCP and answers with
+``^=VPZ.2 @4,35$`` replies, keeping per zone state. Latency, jitter,
+fragmented writes and dropped connections can be injected to exercise
+AmpControlAsync without hardware.
+
+Usage: python -m pyp8.simulator --port 50005 --zones 32
+"""
+import argparse
+import asyncio
+import logging
+import random
+
+LOG = logging.getLogger(__name__)
+
+# [command] -> (field, minimum, maximum)
+ZONE_COMMANDS = {
+    'PZ': ('power', 0, 1),
+    'VPZ': ('volume', 0, 100),
+    'MZ': ('mute', 0, 1),
+    'SZ': ('source', 1, None),     # Maximum is the number of sources
+    'BAZ': ('bass', -12, 12),
+    'TRZ': ('treble', -12, 12),
+    'BLZ': ('balance', -10, 10),
+}
+# [command] -> label prefix, answered for zones and sources respectively
+LABEL_COMMANDS = {
+    'NZ': 'Zone',
+    'NS': 'Source',
+}
+FIRMWARE = '1.0.0'
+
+
+class MatrixSimulator:
+    def __init__(self, zones=64, sources=16, latency=0.0, jitter=0.0, command_time=0.0,
+                 fragment=None, drop_rate=0.0, seed=None):
+        self.zones = zones
+        self.sources = sources
+        self.latency = latency              # Seconds before answering each read
+        self.jitter = jitter                # Random extra latency, up to this many seconds
+        self.command_time = command_time    # Seconds spent processing each command
+        self.fragment = fragment            # Split replies into writes of at most this many bytes
+        self.drop_rate = drop_rate          # Chance of dropping the connection per command
+        self.random = random.Random(seed)
+        self.firmware = FIRMWARE
+        self.state = {
+            field: [max(minimum, 0)] * (zones + 1) for field, minimum, _ in ZONE_COMMANDS.values()
+        }
+        self.commands = 0
+        self.server = None
+        self._writers = set()
+
+    @property
+    def port(self):
+        return self.server.sockets[0].getsockname()[1]
+
+    async def start(self, host='127.0.0.1', port=0):
+        self.server = await asyncio.start_server(self._handle, host, port)
+        LOG.debug(f'Simulator listening on {host}:{self.port}')
+        return self.port
+
+    async def stop(self):
+        self.drop_connections()
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+
+    def drop_connections(self):
+        """Abruptly close every client connection."""
+        for writer in list(self._writers):
+            writer.transport.abort()
+        self._writers.clear()
+
+    def execute(self, command):
+        """Apply one command such as '^VPZ @4,@5, +2' and return the reply lines."""
+        name, _, args = command.strip().lstrip('^').partition(' ')
+        if name == 'FW':
+            return [f'^=FW.2 @0,{self.firmware}$']
+        if name in LABEL_COMMANDS:
+            return self._labels(name, args)
+        if name not in ZONE_COMMANDS:
+            return [f'^!{name}$']
+        field, minimum, maximum = ZONE_COMMANDS[name]
+        if maximum is None:
+            maximum = self.sources
+        *targets, value = [arg.strip() for arg in args.split(',')]
+        values = self.state[field]
+
+        replies = []
+        for target in targets:
+            try:
+                zone = int(target.lstrip('@'))
+                if not 1 <= zone <= self.zones:
+                    raise ValueError(zone)
+                # Signed fields take absolute values only
+                if value[:1] in '+-' and minimum >= 0:
+                    values[zone] = min(max(values[zone] + int(value), minimum), maximum)
+                elif value != '?':
+                    new = int(value)
+                    if not minimum <= new <= maximum:
+                        raise ValueError(new)
+                    values[zone] = new
+            except ValueError:
+                replies.append(f'^!{name}$')
+                continue
+            replies.append(f'^={name}.2 @{zone},{values[zone]}$')
+        return replies
+
+    def _labels(self, name, args):
+        prefix = LABEL_COMMANDS[name]
+        count = self.zones if name == 'NZ' else self.sources
+        *targets, _ = [arg.strip() for arg in args.split(',')]
+        replies = []
+        for target in targets:
+            try:
+                number = int(target.lstrip('@'))
+            except ValueError:
+                number = 0
+            if 1 <= number <= count:
+                replies.append(f'^={name}.2 @{number},"{prefix} {number}"$')
+            else:
+                replies.append(f'^!{name}$')
+        return replies
+
+    async def _handle(self, reader, writer):
+        self._writers.add(writer)
+        buffer = b''
+        try:
+            while data := await reader.read(4096):
+                buffer += data
+                *commands, buffer = buffer.split(b'$')
+                if self.latency or self.jitter:
+                    await asyncio.sleep(self.latency + self.random.uniform(0, self.jitter))
+
+                replies = []
+                for command in commands:
+                    self.commands += 1
+                    if self.drop_rate and self.random.random() < self.drop_rate:
+                        LOG.debug('Simulator dropping connection')
+                        writer.transport.abort()
+                        return
+                    if self.command_time:
+                        await asyncio.sleep(self.command_time)
+                    replies.extend(self.execute(command.decode(errors='replace')))
+                if replies:
+                    await self._write(writer, ''.join(f'{reply}\r\n' for reply in replies).encode())
+        except ConnectionError:
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    async def _write(self, writer, data):
+        if not self.fragment:
+            writer.write(data)
+        else:
+            while data:
+                size = self.random.randint(1, self.fragment)
+                writer.write(data[:size])
+                data = data[size:]
+                await writer.drain()
+                await asyncio.sleep(0)
+        await writer.drain()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='Simulate a Pulse-Eight ProAudio matrix')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=50005)
+    parser.add_argument('--zones', type=int, default=64)
+    parser.add_argument('--sources', type=int, default=16)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--command-time', type=float, default=0.0)
+    parser.add_argument('--fragment', type=int, default=None)
+    parser.add_argument('--drop-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    simulator = MatrixSimulator(args.zones, args.sources, args.latency, args.jitter,
+                                args.command_time, args.fragment, args.drop_rate)
+    await simulator.start(args.host, args.port)
+    await simulator.server.serve_forever()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.DEBUG)
+    asyncio.run(main())
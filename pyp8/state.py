@@ -0,0 +1,66 @@
+"""Latest known status of every zone on a matrix."""
+from typing import Any, NamedTuple
+
+from .protocol import MAX_ZONES
+
+
+class StatusDelta(NamedTuple):
+    zone: int
+    field: str
+    old: Any    # None if the field was not known before
+    new: Any
+
+
+class ZoneStateTable:
+    """Fixed size per field columns indexed by zone, with change detection.
+
+    Only changes are reported, so repeated echoes of the same value from the
+    matrix do not reach subscribers.
+    """
+
+    def __init__(self, fields=(), zones=MAX_ZONES):
+        self.zones = zones
+        self._columns = {}  # [field] -> values indexed by zone, None if unknown
+        for field in fields:
+            self.add_field(field)
+
+    def add_field(self, field):
+        return self._columns.setdefault(field, [None] * (self.zones + 1))
+
+    def update(self, zone, field, value):
+        """Store a reported value, returning a StatusDelta if it changed."""
+        if not 1 <= zone <= self.zones:
+            return None
+        column = self._columns.get(field)
+        if column is None:
+            column = self.add_field(field)
+        old = column[zone]
+        if old == value and old is not None:
+            return None
+        column[zone] = value
+        return StatusDelta(zone, field, old, value)
+
+    def get(self, zone, field, default=None):
+        column = self._columns.get(field)
+        if column is None or not 1 <= zone <= self.zones:
+            return default
+        value = column[zone]
+        return default if value is None else value
+
+    def zone(self, zone):
+        """Return the known fields of one zone as a new dict."""
+        return {
+            field: column[zone] for field, column in self._columns.items()
+            if column[zone] is not None
+        }
+
+    def snapshot(self, zones=None):
+        """Return {zone: {field: value}} for the given or all zones with known status."""
+        if zones is None:
+            zones = range(1, self.zones + 1)
+        snapshot = {}
+        for zone in zones:
+            status = self.zone(zone)
+            if status:
+                snapshot[zone] = status
+        return snapshot
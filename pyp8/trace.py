@@ -0,0 +1,175 @@
+"""Record the traffic of a matrix connection and replay it into a controller.
+
+Traces are append-only JSONL, one record per line::
+
+    {"t": 0.012, "dir": "out", "data": "^VPZ @4, 35$"}
+    {"t": 0.031, "dir": "in", "data": "^=VPZ.2 @4,35$"}
+
+``t`` is seconds since recording started, outgoing records hold a whole
+socket write and incoming records a single reply.
+
+Usage: python -m pyp8.trace record HOST PORT trace.jsonl [--seconds 60]
+       python -m pyp8.trace replay trace.jsonl [--speed 1]
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import logging
+import time
+
+LOG = logging.getLogger(__name__)
+
+FLUSH_RECORDS = 256     # Records buffered before a write to disk is scheduled
+FLUSH_INTERVAL = 1.0    # Seconds before a partly filled buffer is written anyway
+MAX_PENDING = 10000     # Records held while the disk falls behind, further records are dropped
+
+
+class TraceRecorder:
+    """Wire tap for AsyncSocketConnection, appending records to a JSONL file.
+
+    Records are buffered in memory and written by one worker thread, so the
+    event loop never blocks on the disk and batches land in record order. When writes fall behind by
+    more than max_pending records new records are dropped and counted.
+    """
+
+    def __init__(self, path, flush_records=FLUSH_RECORDS, flush_interval=FLUSH_INTERVAL,
+                 max_pending=MAX_PENDING):
+        self.path = path
+        self.flush_records = flush_records
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.records = 0
+        self.dropped = 0
+        self._start = time.monotonic()
+        self._buffer = []
+        self._pending = 0           # Records handed to the executor but not yet written
+        self._flush_handle = None
+        self._writes = set()
+        self._executor = concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix='pyp8-trace')
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def record(self, direction, data):
+        if self._file is None:
+            return
+        if len(self._buffer) + self._pending >= self.max_pending:
+            self.dropped += 1
+            return
+        self._buffer.append((time.monotonic() - self._start, direction, data))
+        self.records += 1
+        if len(self._buffer) >= self.flush_records:
+            self.flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.flush_interval, self.flush)
+
+    def flush(self):
+        """Schedule the buffered records to be written."""
+        if self._flush_handle:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._buffer or self._file is None:
+            return
+        records, self._buffer = self._buffer, []
+        self._pending += len(records)
+        future = asyncio.get_running_loop().run_in_executor(self._executor, self._write, records)
+        self._writes.add(future)
+        future.add_done_callback(self._written)
+
+    def _write(self, records):
+        self._file.write(''.join(
+            json.dumps({'t': round(t, 6), 'dir': direction, 'data': data}) + '\n'
+            for t, direction, data in records
+        ))
+        self._file.flush()
+        return len(records)
+
+    def _written(self, future):
+        self._writes.discard(future)
+        if future.cancelled():
+            return
+        if future.exception():
+            LOG.error('Trace write to %s failed: %s', self.path, future.exception())
+            return
+        self._pending -= future.result()
+
+    async def close(self):
+        """Write out everything recorded so far and close the file."""
+        self.flush()
+        if self._writes:
+            await asyncio.wait(list(self._writes))
+        self._executor.shutdown(wait=False)
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def read_trace(path, direction='in'):
+    """Yield (t, data) for the records of one direction in a trace file."""
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record['dir'] == direction:
+                yield record['t'], record['data']
+
+
+async def replay(path, callback, speed=None):
+    """Feed the replies recorded in a trace to callback, e.g. amp.response_cb.
+
+    With speed None replies are delivered as fast as callback accepts
+    them, otherwise with the recorded spacing divided by speed. Returns
+    the replay statistics.
+    """
+    records = list(read_trace(path))
+    start = time.perf_counter()
+    for t, data in records:
+        if speed:
+            delay = t / speed - (time.perf_counter() - start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        await callback(data)
+    seconds = time.perf_counter() - start
+    return {
+        'lines': len(records),
+        'seconds': seconds,
+        'lines_per_second': len(records) / seconds if seconds else None,
+    }
+
+
+async def main():
+    from . import async_get_amp_controller
+
+    parser = argparse.ArgumentParser(description='Record or replay Pulse-Eight matrix traffic')
+    commands = parser.add_subparsers(dest='command', required=True)
+    record = commands.add_parser('record', help='Capture traffic while polling every zone')
+    record.add_argument('host')
+    record.add_argument('port', type=int)
+    record.add_argument('path')
+    record.add_argument('--seconds', type=float, default=60)
+    record.add_argument('--zones', type=int, default=64)
+    play = commands.add_parser('replay', help='Feed a trace through the parser and state table')
+    play.add_argument('path')
+    play.add_argument('--speed', type=float, default=None, help='1 for real time, default as fast as possible')
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        tap = TraceRecorder(args.path)
+        amp = await async_get_amp_controller(args.host, args.port, trace=tap)
+        await amp.connect()
+        await amp.get_status_many(range(1, args.zones + 1))
+        amp.start_polling()
+        await asyncio.sleep(args.seconds)
+        await amp.close()
+        await tap.close()
+        print(json.dumps({'records': tap.records, 'dropped': tap.dropped}))
+    else:
+        amp = await async_get_amp_controller('replay', 0)
+        result = await replay(args.path, amp.response_cb, args.speed)
+        result['zones'] = len(amp.zones)
+        print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -0,0 +1,132 @@
+import logging
+from datetime import timedelta
+
+from homeassistant.components.sensor import SensorEntity, SensorStateClass
+from homeassistant.const import CONF_HOST, CONF_NAME, CONF_PORT
+from homeassistant.helpers.entity import EntityCategory
+
+from .const import CONF_SOURCES, DOMAIN
+from .pyp8.events import COALESCE
+
+LOG = logging.getLogger(__name__)
+
+SCAN_INTERVAL = timedelta(seconds=60)
+
+
+async def async_setup_platform(hass, config, async_add_entities, discovery_info=None):
+    """Set up the sensors for a matrix set up by the media player platform."""
+    if discovery_info is None:
+        return
+    amp_name = discovery_info[CONF_NAME]
+    amp = hass.data[DOMAIN][(discovery_info[CONF_HOST], discovery_info[CONF_PORT])]
+    async_add_entities([AmpDiagnosticsSensor(amp_name, amp)], True)
+    async_add_source_sensors(hass, amp, amp_name, discovery_info[CONF_SOURCES], async_add_entities)
+
+
+async def async_setup_entry(hass, entry, async_add_entities):
+    amp = hass.data[DOMAIN][entry.entry_id]
+    amp_name = entry.data[CONF_NAME]
+    async_add_entities([AmpDiagnosticsSensor(amp_name, amp, entry.entry_id)], True)
+    entry.async_on_unload(
+        async_add_source_sensors(hass, amp, amp_name, {}, async_add_entities, entry.entry_id)
+    )
+
+
+def async_add_source_sensors(hass, amp, amp_name, names, async_add_entities, unique_key=None):
+    """Add a sensor per named source, and one for any other source once a zone uses it.
+
+    Only the sensors of the sources a zone left or joined are written, from
+    the routing index, so no zones are rescanned. Returns a function that
+    stops the updates.
+    """
+    sensors = {}    # [source_id] -> SourceZonesSensor
+
+    def create(source_id):
+        name = names.get(source_id) or amp.labels['source_name'].get(source_id) or f'Source {source_id}'
+        sensor = sensors[source_id] = SourceZonesSensor(amp_name, amp, source_id, name, unique_key)
+        return sensor
+
+    async def consume_events():
+        async for delta in events:
+            for source_id in (delta.old, delta.new):
+                if source_id is None:
+                    continue
+                sensor = sensors.get(source_id)
+                if sensor is None:
+                    async_add_entities([create(source_id)])
+                elif sensor.hass is not None:
+                    sensor.async_write_ha_state()
+
+    def connection_cb(connected):
+        for sensor in sensors.values():
+            if sensor.hass is not None:
+                sensor.async_write_ha_state()
+
+    def remove():
+        task.cancel()
+        events.close()
+        amp.unsubscribe_connection(connection_cb)
+
+    # Sources a shared, already synced controller has seen in use get theirs now
+    source_ids = dict.fromkeys(names)
+    source_ids.update(dict.fromkeys(amp.routing.sources()))
+    async_add_entities([create(source_id) for source_id in source_ids])
+    events = amp.events(fields=('source',), overflow=COALESCE)
+    task = hass.async_create_background_task(consume_events(), f'{DOMAIN} {amp_name} source sensors')
+    amp.subscribe_connection(connection_cb)
+    return remove
+
+
+class AmpDiagnosticsSensor(SensorEntity):
+    """Replies received from the matrix, with the connection metrics as attributes."""
+
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_state_class = SensorStateClass.TOTAL_INCREASING
+    _attr_native_unit_of_measurement = 'replies'
+
+    def __init__(self, amp_name, amp, unique_key=None):
+        self._amp = amp
+        self._attr_name = f'{amp_name} connection'
+        self._attr_unique_id = f'{DOMAIN}_{unique_key or amp_name}_connection'.lower().replace(' ', '_')
+        self._diagnostics = {}
+
+    async def async_update(self):
+        # Metrics are only gathered when Home Assistant polls, so idle cost is nil
+        self._diagnostics = self._amp.diagnostics()
+
+    @property
+    def available(self):
+        return self._amp.connected
+
+    @property
+    def native_value(self):
+        return self._diagnostics.get('lines_in')
+
+    @property
+    def extra_state_attributes(self):
+        return self._diagnostics
+
+
+class SourceZonesSensor(SensorEntity):
+    """Number of zones switched to a source, with the zones as an attribute."""
+
+    _attr_should_poll = False
+    _attr_native_unit_of_measurement = 'zones'
+
+    def __init__(self, amp_name, amp, source_id, source_name, unique_key=None):
+        self._amp = amp
+        self._source_id = source_id
+        self._attr_name = f'{amp_name} {source_name} zones'
+        self._attr_unique_id = f'{DOMAIN}_{unique_key or amp_name}_source_{source_id}'.lower().replace(' ', '_')
+
+    @property
+    def available(self):
+        return self._amp.connected
+
+    @property
+    def native_value(self):
+        return len(self._amp.routing.zones(self._source_id))
+
+    @property
+    def extra_state_attributes(self):
+        return {'zones': sorted(self._amp.routing.zones(self._source_id))}
@@ -0,0 +1,91 @@
+"""VolumeRamper against the matrix simulator.
+
+Run from the repository root with ``python -m pytest tests``.
+"""
+import asyncio
+
+from pyp8 import async_get_amp_controller
+from pyp8.simulator import MatrixSimulator
+
+
+async def _connected(simulator):
+    amp = await async_get_amp_controller('127.0.0.1', await simulator.start())
+    await amp.connect()
+    return amp
+
+
+def test_abandoned_ramp_does_not_break_later_commands():
+    async def scenario():
+        simulator = MatrixSimulator(zones=4)
+        amp = await _connected(simulator)
+        try:
+            await amp.set_volume_many({1: 10, 2: 10}, confirm=True)
+            # The caller gives up waiting, which cancels the ramp futures
+            try:
+                await asyncio.wait_for(amp.ramp_volume([1, 2], 60, 1.0), 0.1)
+            except asyncio.TimeoutError:
+                pass
+            # Cancelling, retargeting and finishing an abandoned ramp must not raise
+            await amp.set_volume(1, 33, confirm=True)
+            assert await amp.ramp_volume([2], 80, 0.2)
+            await asyncio.sleep(0.1)
+            assert amp.state.get(1, 'volume') == 33
+            assert amp.state.get(2, 'volume') == 80
+        finally:
+            await amp.close()
+            await simulator.stop()
+
+    asyncio.run(asyncio.wait_for(scenario(), 10))
+
+
+def test_failed_step_does_not_stall_other_ramps():
+    async def scenario():
+        simulator = MatrixSimulator(zones=4)
+        amp = await _connected(simulator)
+        send_many = amp.send_many
+        failures = []
+
+        async def flaky_send_many(command, values, **kwargs):
+            if not failures:
+                failures.append(values)
+                raise RuntimeError('step failed')
+            return await send_many(command, values, **kwargs)
+
+        try:
+            await amp.set_volume_many({3: 10, 4: 10}, confirm=True)
+            amp.send_many = flaky_send_many
+            assert await amp.ramp_volume([3, 4], 50, 0.3)
+            await asyncio.sleep(0.1)
+            assert failures
+            assert amp.state.get(3, 'volume') == 50
+            assert amp.state.get(4, 'volume') == 50
+        finally:
+            await amp.close()
+            await simulator.stop()
+
+    asyncio.run(asyncio.wait_for(scenario(), 10))
+
+
+def test_ramp_on_unsynced_zone_reaches_target():
+    async def scenario():
+        simulator = MatrixSimulator(zones=4)
+        simulator.execute('^VPZ @1, 20$')
+        amp = await _connected(simulator)
+        try:
+            # The starting volume is queried first, then faded from
+            assert await amp.ramp_volume([1], 60, 0.3)
+            await asyncio.sleep(0.1)
+            assert simulator.state['volume'][1] == 60
+            assert simulator.commands > 2
+
+            # Without any known volume the target is still sent
+            commands = simulator.commands
+            assert await amp.ramper.ramp([2], 40, 0.3)
+            await asyncio.sleep(0.1)
+            assert simulator.state['volume'][2] == 40
+            assert simulator.commands == commands + 1
+        finally:
+            await amp.close()
+            await simulator.stop()
+
+    asyncio.run(asyncio.wait_for(scenario(), 10))